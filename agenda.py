@@ -0,0 +1,168 @@
+import csv
+import hashlib
+import io
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import requests
+
+# --- AGENDA DE CONCIERTOS ---
+# Descarga el CSV publicado de Google Sheets. La caché vive en el proceso (no en la sesión de
+# Streamlit) para que el calentamiento al arrancar y la UI compartan la misma descarga.
+
+AGENDA_TTL = 3600
+
+_session = requests.Session()
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def download_agenda(url):
+    """Descarga la agenda (sin caché de lectura) y actualiza la caché. Lanza excepción si falla."""
+    response = _session.get(url, timeout=30)
+    response.raise_for_status()
+    with _cache_lock:
+        _cache[url] = (time.monotonic(), response.text)
+    return response.text
+
+
+def fetch_agenda_csv(url, ttl=AGENDA_TTL):
+    """Devuelve el CSV de la caché si tiene menos de `ttl` segundos; si no, lo descarga. Lanza excepción si falla."""
+    with _cache_lock:
+        cached = _cache.get(url)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+    return download_agenda(url)
+
+
+def fetch_agenda_data(url, ttl=AGENDA_TTL):
+    """
+    Devuelve el CSV crudo de la agenda como texto.
+    Utilizamos caché para no saturar la API de Google Sheets en cada recarga.
+    """
+    if not url:
+        return "No hay URL de agenda configurada."
+
+    try:
+        return fetch_agenda_csv(url, ttl) # Devolvemos el CSV crudo como texto
+    except Exception as e:
+        # Los errores no se cachean: la siguiente recarga vuelve a intentarlo
+        return f"Error leyendo agenda: {str(e)}"
+
+
+# --- INTERPRETACIÓN DE LA AGENDA ---
+# La hoja la mantiene la banda a mano, así que las cabeceras se buscan por sinónimos
+# (sin tildes ni mayúsculas) en lugar de por posición.
+COLUMN_ALIASES = {
+    "date": ("fecha", "date", "dia"),
+    "city": ("ciudad", "city", "localidad", "poblacion"),
+    "venue": ("sala", "lugar", "venue", "recinto", "lugar/sala"),
+    "link": ("entradas", "link", "url", "enlace", "tickets"),
+}
+
+_DATE_RE = re.compile(r"(\d{1,2})[/\-.](\d{1,2})(?:[/\-.](\d{2,4}))?")
+_ISO_DATE_RE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+_SPACES_RE = re.compile(r"\s+")
+# Una fecha sin año ya pasada se entiende como del año siguiente solo si así queda a pocos
+# días vista (en diciembre, "05/01" es el enero próximo). Si no, es un concierto pasado.
+YEAR_ROLLOVER_DAYS = 60
+
+
+@dataclass(frozen=True)
+class Gig:
+    """Concierto de la agenda. row_hash cambia si se edita cualquier celda de su fila."""
+    date: date
+    city: str
+    venue: str
+    link: str
+    row_hash: str
+
+    @property
+    def key(self):
+        return gig_key(self.date.strftime("%d/%m"), self.city, self.venue)
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFD", (text or "").strip().lower())
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return _SPACES_RE.sub(" ", text)
+
+
+def parse_date(value, today=None):
+    """
+    Interpreta 'DD/MM', 'DD/MM/AAAA' o 'AAAA-MM-DD'. Sin año se asume el año en curso, salvo
+    que la fecha ya haya pasado y en el año que viene quede a YEAR_ROLLOVER_DAYS días o menos
+    (en diciembre, "05/01" es el enero próximo; en octubre, "15/01" es el enero pasado).
+    """
+    today = today or datetime.now().date()
+    value = (value or "").strip()
+    try:
+        match = _ISO_DATE_RE.search(value)
+        if match:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        match = _DATE_RE.search(value)
+        if match:
+            day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+            if year:
+                return date(int(year) + (2000 if len(year) == 2 else 0), month, day)
+            parsed = date(today.year, month, day)
+            # Un 29/02 ya pasado no existe el año siguiente: se queda como concierto pasado
+            if parsed < today and not (month == 2 and day == 29):
+                next_year = date(today.year + 1, month, day)
+                if (next_year - today).days <= YEAR_ROLLOVER_DAYS:
+                    return next_year
+            return parsed
+    except ValueError:
+        pass
+    return None
+
+
+def gig_key(date_text, city, venue):
+    """
+    Clave de búsqueda de un concierto: fecha DD/MM + ciudad + sala normalizadas.
+    Es la misma para la fila de la agenda y para lo que el usuario escribe en el formulario.
+    """
+    parsed = parse_date(date_text)
+    day = parsed.strftime("%d/%m") if parsed else _normalize(date_text)
+    return f"{day}|{_normalize(city)}|{_normalize(venue)}"
+
+
+def parse_agenda(csv_text, today=None, upcoming_only=True):
+    """Convierte el CSV de la agenda en una lista de Gig (por defecto, solo los futuros)."""
+    today = today or datetime.now().date()
+    reader = csv.reader(io.StringIO(csv_text))
+    header = next(reader, None)
+    if not header:
+        return []
+
+    normalized_header = [_normalize(h) for h in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for index, name in enumerate(normalized_header):
+            if name in aliases:
+                columns[field] = index
+                break
+    if "date" not in columns:
+        return []
+
+    def cell(row, field):
+        index = columns.get(field)
+        return row[index].strip() if index is not None and index < len(row) else ""
+
+    gigs = []
+    for row in reader:
+        gig_date = parse_date(cell(row, "date"), today)
+        if gig_date is None or (upcoming_only and gig_date < today):
+            continue
+        gigs.append(Gig(
+            date=gig_date,
+            city=cell(row, "city"),
+            venue=cell(row, "venue"),
+            link=cell(row, "link"),
+            row_hash=hashlib.sha256("\x1f".join(row).encode("utf-8")).hexdigest(),
+        ))
+    return gigs
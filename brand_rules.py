@@ -0,0 +1,271 @@
+import re
+import time
+import unicodedata
+from dataclasses import dataclass
+
+# --- MOTOR DE REGLAS DE MARCA (REGLAS DE ORO) ---
+# El prompt del sistema *pide* las REGLAS DE ORO, pero nada garantiza que el LLM las cumpla.
+# Este módulo las comprueba de forma determinista sobre el copy ya limpio, corrige en local
+# las infracciones mecánicas (emojis, hashtags, longitud) y devuelve el resto para que
+# solo esas vuelvan al LLM. Todos los patrones se compilan una única vez al importar.
+
+# Límites de las reglas
+MAX_EMOJIS = 3
+MAX_FAN_WORD = 1
+WHATSAPP_MAX_CHARS = 500
+
+# Palabra de comunidad (solo puede aparecer una vez y nunca al principio)
+FAN_WORD = "Arrojers"
+
+# Clichés prohibidos (se comparan sin tildes y en minúsculas)
+BANNED_CLICHES = [
+    "Noche inolvidable",
+    "Lo vamos a romper",
+    "Velada mágica",
+]
+
+# Léxico de formas en 2ª persona del plural (vosotros) que no se detectan por terminación.
+# Imperativos (-ad/-ed/-id), pronombres y posesivos más habituales en un copy de concierto.
+# Se guardan sin tildes porque se comparan con la palabra ya normalizada. "id" y "sed" no
+# están: también son "ID del evento" o "sed de rock" (ver _ID_IMPERATIVE_RE).
+PLURAL_LEXICON = {
+    "vosotros", "vosotras", "vuestro", "vuestra", "vuestros", "vuestras",
+    "venid", "veniros", "venios", "idos", "preparaos", "preparad",
+    "traed", "corred", "pillad", "comprad", "escuchad", "compartid", "dadle",
+    "dad", "mirad", "cantad", "gritad", "saltad", "bailad", "animaos", "apuntaos",
+    "reservad", "guardad", "seguid", "decid", "contadnos", "decidnos", "avisad",
+    "etiquetad", "comentad", "disfrutad", "acompanadnos", "uniros", "unios",
+    # Presentes en -ís de verbos -ir: se listan en lugar de buscar la terminación, porque
+    # "-ís" también es París, anís, esquís o marroquís (y "-is" sin tilde, tenis o crisis)
+    "venis", "salis", "vivis", "decis", "sentis", "subis", "pedis", "seguis", "escribis",
+    "recibis", "abris", "dormis", "repetis", "elegis", "compartis", "conseguis", "sufris",
+}
+
+# Palabras con terminación de vosotros (-áis/-éis/-ois) que no lo son. Sin tildes.
+NOT_PLURAL = {
+    "pais", "seis", "dieciseis", "veintiseis", "jerseis", "bonsais", "samurais",
+    "paipais", "espais", "sprais", "guirigais",
+}
+
+# Plataformas donde el campo 'hashtags' debe ir vacío
+EMPTY_HASHTAG_PLATFORMS = ("Instagram (Stories)", "WhatsApp")
+
+# --- PATRONES PRECOMPILADOS ---
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Terminaciones de vosotros: con tilde (-áis/-éis/-óis) o escritas sin ninguna tilde
+# (-ais/-eis/-ois). Las excepciones están en NOT_PLURAL.
+_PLURAL_ACCENTED_RE = re.compile(r"(?:áis|éis|óis)$")
+_PLURAL_PLAIN_RE = re.compile(r"(?:ais|eis|ois)$")
+# "id" solo como imperativo de ir ("Id a por tu entrada"), nunca "ID del evento"
+_ID_IMPERATIVE_RE = re.compile(r"\bid\s+(?:a|al|por|y)\b", re.IGNORECASE)
+_OS_CLITIC_RE = re.compile(r"\bos\b", re.IGNORECASE)
+_FAN_WORD_RE = re.compile(rf"\b{FAN_WORD}\b", re.IGNORECASE)
+_LEADING_NOISE_RE = re.compile(r"^[\W_]+")
+
+# Un "emoji" es un grupo visual: base + modificadores de tono + selector de variante,
+# encadenado con ZWJ (p. ej. 👨 + ZWJ + 🎤), o una bandera (pareja de indicadores regionales).
+_EMOJI_BASE = (
+    "\U0001F300-\U0001F5FF"  # Símbolos y pictogramas
+    "\U0001F600-\U0001F64F"  # Caras
+    "\U0001F680-\U0001F6FF"  # Transporte y mapas
+    "\U0001F900-\U0001F9FF"  # Pictogramas suplementarios
+    "\U0001FA70-\U0001FAFF"  # Pictogramas extendidos
+    "\U00002600-\U000027BF"  # Símbolos varios y dingbats
+    "\U00002B00-\U00002BFF"  # Flechas y estrellas (⭐)
+)
+_EMOJI_RE = re.compile(
+    rf"(?:[\U0001F1E6-\U0001F1FF]{{2}}"
+    rf"|[0-9#*]\uFE0F?\u20E3"
+    rf"|[{_EMOJI_BASE}][\U0001F3FB-\U0001F3FF]?\uFE0F?"
+    rf"(?:\u200D[{_EMOJI_BASE}][\U0001F3FB-\U0001F3FF]?\uFE0F?)*)"
+)
+
+# Final de frase: signo de cierre o salto de línea
+_SENTENCE_END_RE = re.compile(r"[.!?…](?=\s|$)|\n")
+_MULTI_SPACE_RE = re.compile(r"[ \t]{2,}")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"[ \t]+([,.!?…])")
+
+
+@dataclass(frozen=True)
+class Violation:
+    """Infracción de una regla de marca detectada en un copy."""
+    rule: str
+    message: str
+    fixable: bool
+
+
+def _strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def _find_plural_forms(text):
+    """Devuelve las formas en 2ª persona del plural encontradas (sin duplicados, en orden)."""
+    found = []
+    for word in _WORD_RE.findall(text):
+        lower = word.lower()
+        plain = _strip_accents(lower)
+        if plain in NOT_PLURAL:
+            continue
+        if (plain in PLURAL_LEXICON or _PLURAL_ACCENTED_RE.search(lower)
+                or (lower == plain and _PLURAL_PLAIN_RE.search(plain))):
+            found.append(word)
+    found.extend(m.group(0) for m in _ID_IMPERATIVE_RE.finditer(text))
+    found.extend(m.group(0) for m in _OS_CLITIC_RE.finditer(text))
+    return list(dict.fromkeys(found))
+
+
+def _starts_with_fan_word(text, fan_word_re):
+    # Ignoramos emojis, signos y espacios iniciales ("🔥 ¡Arrojers!" también cuenta como inicio)
+    first_line = _LEADING_NOISE_RE.sub("", text.lstrip().split("\n", 1)[0])
+    match = fan_word_re.search(first_line)
+    return match is not None and match.start() == 0
+
+
+def _needs_empty_hashtags(platform):
+    return any(p in platform for p in EMPTY_HASHTAG_PLATFORMS)
+
+
+def check_post(text, hashtags, platform, fan_word=FAN_WORD, cliches=BANNED_CLICHES):
+    """
+    Comprueba las REGLAS DE ORO sobre un copy ya limpio.
+    Devuelve una lista de Violation (vacía si el copy cumple todas las reglas).
+    """
+    violations = []
+    fan_word_re = _FAN_WORD_RE if fan_word == FAN_WORD else re.compile(rf"\b{re.escape(fan_word)}\b", re.IGNORECASE)
+
+    # 1. REGLA DEL TÚ
+    plural_forms = _find_plural_forms(text)
+    if plural_forms:
+        violations.append(Violation(
+            "segunda_persona",
+            f"Usa 2ª persona del plural ({', '.join(plural_forms)}). Debe ser 2ª persona singular (tú).",
+            fixable=False,
+        ))
+
+    # 2. PALABRA DE COMUNIDAD
+    fan_count = len(fan_word_re.findall(text))
+    if fan_count > MAX_FAN_WORD:
+        violations.append(Violation(
+            "fan_word_repetida",
+            f'"{fan_word}" aparece {fan_count} veces (máximo {MAX_FAN_WORD}).',
+            fixable=False,
+        ))
+    if fan_count and _starts_with_fan_word(text, fan_word_re):
+        violations.append(Violation(
+            "fan_word_inicio",
+            f'El copy empieza con "{fan_word}". Nunca puede ir al inicio.',
+            fixable=False,
+        ))
+
+    # 3. EMOJIS
+    emoji_count = len(_EMOJI_RE.findall(text))
+    if emoji_count > MAX_EMOJIS:
+        violations.append(Violation(
+            "emojis",
+            f"Tiene {emoji_count} emojis (máximo {MAX_EMOJIS}).",
+            fixable=True,
+        ))
+
+    # 4. ANTI-CLICHÉ
+    normalized = _strip_accents(text.lower())
+    found_cliches = [c for c in cliches if _strip_accents(c.lower()) in normalized]
+    if found_cliches:
+        violations.append(Violation(
+            "cliche",
+            f"Contiene clichés prohibidos: {', '.join(found_cliches)}.",
+            fixable=False,
+        ))
+
+    # 5. LONGITUD WHATSAPP
+    if "WhatsApp" in platform and len(text) >= WHATSAPP_MAX_CHARS:
+        violations.append(Violation(
+            "longitud",
+            f"Tiene {len(text)} caracteres (WhatsApp: menos de {WHATSAPP_MAX_CHARS}).",
+            fixable=True,
+        ))
+
+    # 6. HASHTAGS VACÍOS (Stories / WhatsApp)
+    if _needs_empty_hashtags(platform) and hashtags and hashtags.strip():
+        violations.append(Violation(
+            "hashtags",
+            f"El campo 'hashtags' debe estar vacío en {platform}.",
+            fixable=True,
+        ))
+
+    return violations
+
+
+def _trim_emojis(text, limit):
+    """Conserva los primeros `limit` emojis y elimina el resto."""
+    kept = 0
+
+    def replacer(match):
+        nonlocal kept
+        kept += 1
+        return match.group(0) if kept <= limit else ""
+
+    text = _EMOJI_RE.sub(replacer, text)
+    # Quitamos los huecos que dejan los emojis eliminados
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", text)
+    text = _MULTI_SPACE_RE.sub(" ", text)
+    return "\n".join(line.rstrip() for line in text.split("\n"))
+
+
+def _trim_to_length(text, max_chars):
+    """Recorta el texto por debajo de `max_chars` cortando en el último final de frase posible."""
+    if len(text) < max_chars:
+        return text
+    window = text[:max_chars - 1]
+    cut = 0
+    for match in _SENTENCE_END_RE.finditer(window):
+        cut = match.end()
+    if cut == 0:
+        # Sin final de frase: cortamos en el último espacio para no partir palabras
+        cut = window.rfind(" ")
+        if cut <= 0:
+            cut = len(window)
+    return text[:cut].rstrip()
+
+
+def autofix_post(text, hashtags, platform, fan_word=FAN_WORD, cliches=BANNED_CLICHES):
+    """
+    Corrige en local las infracciones mecánicas (emojis, longitud, hashtags).
+    Devuelve (texto, hashtags, violaciones_pendientes); las pendientes requieren al LLM.
+    """
+    violations = check_post(text, hashtags, platform, fan_word, cliches)
+    rules = {v.rule for v in violations if v.fixable}
+
+    if "emojis" in rules:
+        text = _trim_emojis(text, MAX_EMOJIS)
+    if "hashtags" in rules:
+        hashtags = ""
+    # La longitud se corrige la última: quitar emojis ya puede dejarlo por debajo del límite
+    if "longitud" in rules:
+        text = _trim_to_length(text, WHATSAPP_MAX_CHARS)
+
+    if not rules:
+        return text, hashtags, violations
+    return text, hashtags, check_post(text, hashtags, platform, fan_word, cliches)
+
+
+# --- MICROBENCHMARK ---
+# Uso: python brand_rules.py
+# Verifica que la validación + autocorrección añade menos de 1 ms por post.
+if __name__ == "__main__":
+    samples = [
+        ("Instagram (Feed)", "🔥🔥 Este viernes te espera el Rock castizo en la Sala Clamores 🎸🤘⚡\n"
+                             "Pilla tu entrada antes de que vuelen. Link en Bio.", "#Rock #Musica"),
+        ("WhatsApp Channel", ("*ARROJO EN MADRID* 🤘 Os esperamos a todos, Arrojers. " * 12).strip(), "#Rock"),
+        ("Instagram (Stories)", "Arrojers, ¿estáis listos? Noche inolvidable 🔥", "#Arrojo"),
+        ("Facebook", "Te esperamos el sábado en Valencia. Entradas: https://arrojorock.es", ""),
+    ]
+    iterations = 2000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for platform, text, tags in samples:
+            autofix_post(text, tags, platform)
+    per_post_ms = (time.perf_counter() - start) * 1000 / (iterations * len(samples))
+    print(f"autofix_post: {per_post_ms:.4f} ms/post ({iterations * len(samples)} posts)")
+    for platform, text, tags in samples:
+        _, _, pending = autofix_post(text, tags, platform)
+        print(f"  [{platform}] pendientes para el LLM: {[v.rule for v in pending]}")
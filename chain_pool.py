@@ -0,0 +1,481 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from operator import itemgetter
+
+import httpx
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_qdrant import QdrantVectorStore
+from pydantic import BaseModel, Field
+from qdrant_client import QdrantClient
+
+from brand_rules import BANNED_CLICHES, FAN_WORD
+from coalescing import RequestGate, SingleFlight
+
+# --- POOL DE CADENAS MULTI-ARTISTA ---
+# Un mismo contenedor puede servir a varias bandas ("tenants"). Cada tenant tiene su colección
+# de Qdrant, su perfil de marca, sus enlaces por defecto y su modelo. Las cadenas se construyen
+# la primera vez que se usan, se guardan en un pool acotado (LRU) y comparten los clientes
+# HTTP/Qdrant, los embeddings y los LLMs del mismo modelo.
+
+DEFAULT_TENANT = "arrojo"
+
+
+# --- 1. CONFIGURACIÓN (.env) ---
+
+@dataclass(frozen=True)
+class Settings:
+    """Configuración común a todos los tenants, leída del .env."""
+    api_key: str
+    base_url: str
+    qdrant_url: str
+    qdrant_key: str
+    qdrant_https: bool
+    qdrant_port: int
+    qdrant_timeout: int
+    embedding_model: str
+    llm_model: str
+    llm_temperature: float
+    llm_timeout: int
+    llm_max_retries: int
+    collection: str
+    agenda_url: str
+    pool_size: int
+    pool_idle_ttl: int
+    tenants_file: str
+    rate_per_minute: int
+    rate_burst: int
+    max_concurrent: int
+    probe_interval: int
+    embedding_probe_interval: int
+    probe_failure_threshold: int
+    readiness_port: int
+    drafts_db: str
+    pregen_targets: tuple
+    pregen_hours: tuple
+    pregen_interval: int
+    pregen_batch_size: int
+    pregen_days_ahead: int
+
+
+def load_settings():
+    """Lee las variables de entorno con las conversiones de tipo necesarias."""
+    return Settings(
+        # Básicas
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        base_url=os.getenv("OPENROUTER_BASE_URL"),
+        # Qdrant: Conversión de tipos para evitar errores de conexión
+        qdrant_url=os.getenv("QDRANT_URL"),
+        qdrant_key=os.getenv("QDRANT_API_KEY"),
+        qdrant_https=os.getenv("QDRANT_HTTPS", "False").lower() == "true",
+        qdrant_port=int(os.getenv("QDRANT_PORT", 6333)),
+        qdrant_timeout=int(os.getenv("QDRANT_TIMEOUT", 60)),
+        # Modelos: Definición de nombres y parámetros técnicos
+        embedding_model=os.getenv("EMBEDDING_MODEL", "qwen/qwen3-embedding-8b"),
+        llm_model=os.getenv("LLM_MODEL", "mistralai/mistral-small-creative"),
+        llm_temperature=float(os.getenv("LLM_TEMPERATURE", 0.7)),
+        llm_timeout=int(os.getenv("LLM_TIMEOUT", 120)),
+        llm_max_retries=int(os.getenv("LLM_MAX_RETRIES", 3)),
+        # Tenant por defecto
+        collection=os.getenv("QDRANT_COLLECTION"),
+        agenda_url=os.getenv("AGENDA_CONCIERTOS"),
+        # Pool: nº máximo de tenants en memoria y segundos de inactividad antes de expulsarlos
+        pool_size=int(os.getenv("CHAIN_POOL_SIZE", 4)),
+        pool_idle_ttl=int(os.getenv("CHAIN_POOL_IDLE_TTL", 3600)),
+        tenants_file=os.getenv("TENANTS_FILE"),
+        # Límite global de llamadas al LLM hacia OpenRouter (compartido por todas las sesiones; 0 = sin límite)
+        rate_per_minute=int(os.getenv("LLM_RATE_PER_MINUTE", 20)),
+        rate_burst=int(os.getenv("LLM_RATE_BURST", 5)),
+        max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", 4)),
+        # Calentamiento y sondas de dependencias (warmup.py)
+        probe_interval=int(os.getenv("PROBE_INTERVAL", 60)),
+        # La sonda de embeddings es una llamada de pago: va aparte y mucho más espaciada (0 = solo al arrancar)
+        embedding_probe_interval=int(os.getenv("EMBEDDING_PROBE_INTERVAL", 21600)),
+        # Fallos seguidos de una sonda para que /ready deje de responder 200 (0 = nunca)
+        probe_failure_threshold=int(os.getenv("PROBE_FAILURE_THRESHOLD", 3)),
+        readiness_port=int(os.getenv("READINESS_PORT", 8502)),
+        # Pregeneración de borradores de conciertos (drafts.py)
+        drafts_db=os.getenv("DRAFTS_DB", "drafts.sqlite3"),
+        # Pares "Plataforma|Formato" separados por comas (vacío = desactivada)
+        pregen_targets=tuple(
+            tuple(t.strip().split("|", 1))
+            for t in os.getenv("PREGEN_TARGETS", "Instagram (Feed)|Foto,Instagram (Stories)|Foto,WhatsApp Channel|Solo Texto").split(",")
+            if "|" in t
+        ),
+        # Franja valle en horas locales "inicio-fin" (fin excluido)
+        pregen_hours=tuple(int(h) for h in os.getenv("PREGEN_HOURS", "2-7").split("-", 1)),
+        pregen_interval=int(os.getenv("PREGEN_INTERVAL", 1800)),
+        pregen_batch_size=int(os.getenv("PREGEN_BATCH_SIZE", 3)),
+        # Solo se pregeneran los conciertos de los próximos N días (cada noche se rehacen)
+        pregen_days_ahead=int(os.getenv("PREGEN_DAYS_AHEAD", 14)),
+    )
+
+
+@dataclass(frozen=True)
+class PromptProfile:
+    """Voz de marca de un artista: se inyecta en el prompt y en el validador de reglas."""
+    band_name: str = "Arrojo"
+    fan_word: str = FAN_WORD
+    style_name: str = "Estilo Arrojer"
+    style_description: str = "canalla, pasional, colega de bar, cercano, CERO corporativo"
+    genre: str = "rock castizo/cañero"
+    # Género en una palabra para la línea de rol del prompt ("CM banda rock ...")
+    genre_short: str = "rock"
+    banned_cliches: tuple = tuple(BANNED_CLICHES)
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    """Configuración de un artista. Es inmutable y hashable para poder usarse como clave."""
+    tenant_id: str
+    display_name: str
+    collection: str
+    llm_model: str
+    agenda_url: str = None
+    prompt_profile: PromptProfile = field(default_factory=PromptProfile)
+    # Tupla de pares (etiqueta, url)
+    default_links: tuple = (
+        ("Web/Entradas/Info oficial", "https://arrojorock.es"),
+        ("Spotify", "https://open.spotify.com/artist/4s0uEp9gcIcvU1ZEsDKQXv"),
+        ("YouTube", "https://www.youtube.com/channel/UCJnAZC6v6OfKxNydcD6CFqQ"),
+    )
+
+
+def load_tenants(settings):
+    """
+    Devuelve {tenant_id: TenantConfig}. El tenant por defecto (Arrojo) sale del .env;
+    TENANTS_FILE puede apuntar a un JSON con una lista de artistas adicionales:
+    [{"tenant_id": "...", "display_name": "...", "collection": "...", "llm_model": "...",
+      "agenda_url": "...", "prompt_profile": {...}, "default_links": {"Etiqueta": "url"}}]
+    """
+    default = TenantConfig(
+        tenant_id=DEFAULT_TENANT,
+        display_name="Arrojo",
+        collection=settings.collection,
+        llm_model=settings.llm_model,
+        agenda_url=settings.agenda_url,
+    )
+    tenants = {default.tenant_id: default}
+
+    if settings.tenants_file:
+        with open(settings.tenants_file, encoding="utf-8") as f:
+            for raw in json.load(f):
+                profile = raw.get("prompt_profile", {})
+                if "banned_cliches" in profile:
+                    profile["banned_cliches"] = tuple(profile["banned_cliches"])
+                tenant = replace(
+                    default,
+                    tenant_id=raw["tenant_id"],
+                    display_name=raw.get("display_name", raw["tenant_id"]),
+                    collection=raw["collection"],
+                    llm_model=raw.get("llm_model", settings.llm_model),
+                    agenda_url=raw.get("agenda_url"),
+                    prompt_profile=PromptProfile(**profile),
+                    default_links=tuple(raw.get("default_links", {}).items()) or default.default_links,
+                )
+                tenants[tenant.tenant_id] = tenant
+
+    return tenants
+
+
+# --- 2. ESTRUCTURA DE SALIDA Y PROMPTS ---
+
+class SocialPost(BaseModel):
+    platform: str = Field(description="Plataforma seleccionada")
+    copy_text: str = Field(description="El texto del post listo para copiar, con emojis y estructura")
+    hashtags: str = Field(description="Etiquetas, Keywords (separadas por comas) o Hashtags (con #), según corresponda a la plataforma.")
+    visual_suggestion: str = Field(description="Sugerencia breve para la imagen/video si no se provee")
+
+
+# Define la voz, el tono y las reglas de negocio del agente.
+# Los datos de marca ({band_name}, {fan_word}...) se rellenan con el PromptProfile del tenant.
+SYSTEM_PROMPT = """
+    ### CONTEXTO
+    FECHA HOY: {current_date} Usar para tiempos relativos: mañana, viernes, en menos de una semana, etc. Y también para comprender si los conciertos en [AGENDA] son pasados o futuros.
+
+    ### ROL
+    CM banda {genre_short} "{band_name}". TONO: {tone_modifier} + "{style_name}" ({style_description}).
+
+    ### REGLAS DE ORO (NO ROMPER)
+    1. REGLA DEL TÚ: SIEMPRE 2ª persona singular ("te espera"). PROHIBIDO plural ("os esperamos", "preparaos").
+    2. PALABRA "{fan_word_upper}": Máx 1 vez. NUNCA en inicio/título.
+    3. EMOJIS: Máx 2-3. Solo para énfasis real.
+    4. ANTI-CLICHÉ: PROHIBIDO {banned_cliches}. Sé crudo, específico y real, como el {genre}.
+
+    ### ESTRATEGIA
+    Si MOTIVO="1. Concierto":
+    - CTA OBLIGATORIO: Link entradas o de localización de la sala.
+    - CTA CREATIVO: Sugerir escuchar temas en Spotify antes...
+
+    ### OPTIMIZACIÓN PLATAFORMA ({platform} - {media_type})
+    {optimization_instruction}
+
+    ### FUENTES DE DATOS
+    [INFO RAG]: {context}
+    [AGENDA]: {agenda_context}
+
+    ### LINKS DEFAULT (Usar si no hay específicos)
+    {default_links}
+
+    ### TAREA
+    Genera el JSON final para:
+    - MOTIVO: {reason}
+    - INPUT DATOS: {specific_data}
+    - VISUAL: {visual_context}
+    - EXTRA: {user_instructions}
+
+    ### FORMATO DE SALIDA
+    {format_instructions}
+
+    Asegúrate de que el contenido del JSON cumpla estas reglas:
+    1. "copy_text": Debe tener el texto completo, con saltos de línea (\n) y emojis.
+    2. "hashtags": Una lista de etiquetas según se indique en la optimización de plataforma.
+    3. "visual_suggestion": Descripción breve.
+    4. "platform": La plataforma seleccionada.
+    """
+
+# Cadena ligera de corrección: solo se invoca cuando el validador local (brand_rules)
+# encuentra infracciones que no puede arreglar por sí mismo (plural, clichés, palabra de fans).
+# No hace RAG: reescribe el copy ya generado indicando exactamente qué reglas rompe.
+REPAIR_PROMPT = """
+    ### ROL
+    CM banda "{band_name}". Corrector de estilo del "{style_name}".
+
+    ### TAREA
+    Reescribe el COPY corrigiendo ÚNICAMENTE estas infracciones de las REGLAS DE ORO:
+    {violations}
+
+    Mantén intactos el mensaje, los datos (fechas, salas, enlaces), los saltos de línea, los emojis y la longitud aproximada.
+    Recuerda: 2ª persona singular ("te espera"), "{fan_word}" máx 1 vez y nunca al inicio, sin clichés.
+
+    ### COPY ({platform})
+    {copy_text}
+
+    ### FORMATO DE SALIDA
+    Devuelve un JSON con una única clave "copy_text" con el texto corregido.
+    """
+
+
+def _profile_variables(tenant):
+    profile = tenant.prompt_profile
+    return {
+        "band_name": profile.band_name,
+        "fan_word": profile.fan_word,
+        "fan_word_upper": profile.fan_word.upper(),
+        "style_name": profile.style_name,
+        "style_description": profile.style_description,
+        "genre": profile.genre,
+        "genre_short": profile.genre_short,
+        "banned_cliches": ", ".join(f'"{c}"' for c in profile.banned_cliches),
+        "default_links": "\n    ".join(f"{label}: {url}" for label, url in tenant.default_links),
+    }
+
+
+# --- 3. CONSTRUCCIÓN DE CADENAS ---
+
+@dataclass
+class TenantChains:
+    """Cadenas listas para usar de un tenant (entrada del pool)."""
+    tenant: TenantConfig
+    chain: object
+    repair_chain: object
+    last_used: float = 0.0
+
+
+class ChainPool:
+    """
+    Pool acotado de cadenas por tenant con expulsión LRU.
+    Los clientes costosos (HTTP, Qdrant, embeddings, LLM por modelo) se crean una sola vez
+    y se comparten entre todos los tenants; solo las cadenas y los prompts son por artista.
+    """
+
+    def __init__(self, settings, tenants=None):
+        self.settings = settings
+        self.tenants = tenants if tenants is not None else load_tenants(settings)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._llms = {}
+
+        # Coalescencia y límite de tasa compartidos por todas las sesiones del proceso
+        self.gate = RequestGate(settings.rate_per_minute, settings.rate_burst, settings.max_concurrent)
+        self.retrieval_flight = SingleFlight()
+
+        # Clientes compartidos: se crean al construir la primera cadena, no al crear el pool,
+        # para que listar tenants (p. ej. en la barra lateral) no abra conexiones.
+        self.http_client = None
+        self.qdrant_client = None
+        self.embeddings = None
+
+    def _ensure_clients(self):
+        # Debe llamarse con el lock tomado
+        if self.http_client is not None:
+            return
+        settings = self.settings
+        self.http_client = httpx.Client(timeout=settings.llm_timeout)
+        # Configuramos el cliente con soporte HTTPS y puerto configurable.
+        self.qdrant_client = QdrantClient(
+            url=settings.qdrant_url,
+            port=settings.qdrant_port,
+            https=settings.qdrant_https,
+            api_key=settings.qdrant_key,
+            timeout=settings.qdrant_timeout
+        )
+        # Debe coincidir exactamente con el usado en la ingesta de datos.
+        self.embeddings = OpenAIEmbeddings(
+            model=settings.embedding_model,
+            openai_api_key=settings.api_key,
+            openai_api_base=settings.base_url,
+            http_client=self.http_client
+        )
+
+    def shared_clients(self):
+        """Devuelve (qdrant_client, embeddings) compartidos, creándolos si hace falta."""
+        with self._lock:
+            self._ensure_clients()
+            return self.qdrant_client, self.embeddings
+
+    def get_llm(self, model):
+        """Devuelve el LLM compartido para `model` (uno por modelo, no por tenant)."""
+        with self._lock:
+            self._ensure_clients()
+            if model not in self._llms:
+                self._llms[model] = ChatOpenAI(
+                    model=model,
+                    openai_api_key=self.settings.api_key,
+                    openai_api_base=self.settings.base_url,
+                    temperature=self.settings.llm_temperature,
+                    timeout=self.settings.llm_timeout,
+                    max_retries=self.settings.llm_max_retries,
+                    http_client=self.http_client,
+                    # Fuerza a la API a esperar un objeto JSON
+                    model_kwargs={"response_format": {"type": "json_object"}}
+                )
+            return self._llms[model]
+
+    def get(self, tenant_id=DEFAULT_TENANT):
+        """Devuelve las TenantChains del tenant, construyéndolas la primera vez (lazy warm)."""
+        if tenant_id not in self.tenants:
+            raise KeyError(f"Tenant desconocido: {tenant_id}")
+
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None:
+                self._entries.move_to_end(tenant_id)
+                entry.last_used = time.monotonic()
+                # También en los aciertos: si no, los tenants inactivos solo se liberarían
+                # al construir uno nuevo y CHAIN_POOL_IDLE_TTL no tendría efecto
+                self._evict()
+                return entry
+
+        # Construimos fuera del lock: crear el vectorstore consulta Qdrant y no debe bloquear
+        # a los demás tenants. Si dos sesiones construyen a la vez, nos quedamos con la primera.
+        built = self._build(self.tenants[tenant_id])
+        with self._lock:
+            entry = self._entries.setdefault(tenant_id, built)
+            self._entries.move_to_end(tenant_id)
+            entry.last_used = time.monotonic()
+            self._evict()
+            return entry
+
+    def _evict(self):
+        # Debe llamarse con el lock tomado
+        now = time.monotonic()
+        for tenant_id in list(self._entries):
+            if len(self._entries) <= 1:
+                break
+            idle = now - self._entries[tenant_id].last_used
+            if len(self._entries) > self.settings.pool_size or idle > self.settings.pool_idle_ttl:
+                del self._entries[tenant_id]
+
+    def _build(self, tenant):
+        with self._lock:
+            self._ensure_clients()
+
+        # A. Base de Datos Vectorial (cliente compartido, colección del tenant)
+        vectorstore = QdrantVectorStore(
+            client=self.qdrant_client,
+            collection_name=tenant.collection,
+            embedding=self.embeddings
+        )
+        # El retriever buscará los 3 fragmentos más relevantes
+        retriever = vectorstore.as_retriever(search_kwargs={"k": 3})
+        # Búsquedas idénticas en curso (misma query y tenant) comparten embedding y resultado
+        coalesced_retriever = RunnableLambda(
+            lambda query: self.retrieval_flight.do(
+                ("retrieve", tenant.tenant_id, query), lambda: retriever.invoke(query)
+            )
+        )
+
+        # B. Modelo de Lenguaje (compartido por modelo)
+        llm = self.get_llm(tenant.llm_model)
+
+        # C. Parser: elimina automáticamente los ```json ``` si el modelo los pone.
+        parser = JsonOutputParser(pydantic_object=SocialPost)
+
+        # D. Prompt con la marca del tenant
+        # Inyectamos format_instructions automáticamente para reforzar la estructura
+        prompt = ChatPromptTemplate.from_template(
+            SYSTEM_PROMPT,
+            partial_variables={"format_instructions": parser.get_format_instructions(), **_profile_variables(tenant)}
+        )
+
+        # E. Construcción de la Cadena (Chain)
+        # Generamos un string de búsqueda optimizado para RAG concatenando los inputs clave.
+        # Extraemos solo los valores del diccionario, ignorando las claves y símbolos.
+        rag_query_generator = (
+            lambda x: (
+                f"{x['reason']} "
+                f"{' '.join([str(v) for v in x['specific_data'].values() if v])} "
+                f"{x['user_instructions']}"
+            )
+        )
+
+        chain = (
+            {
+                # Pasamos la query generada al retriever para buscar contexto
+                "context": rag_query_generator | coalesced_retriever,
+                # Pasamos el resto de variables directamente
+                "agenda_context": itemgetter("agenda_context"),
+                "current_date": itemgetter("current_date"),
+                "platform": itemgetter("platform"),
+                "media_type": itemgetter("media_type"),
+                # Inyectamos la instrucción calculada dinámicamente
+                "optimization_instruction": itemgetter("optimization_instruction"),
+                "reason": itemgetter("reason"),
+                "specific_data": itemgetter("specific_data"),
+                "visual_context": itemgetter("visual_context"),
+                "user_instructions": itemgetter("user_instructions"),
+                "tone_modifier": itemgetter("tone_modifier")
+            }
+            | prompt
+            | llm       # Usamos el LLM base
+            | parser    # El parser limpia el markdown y devuelve un Diccionario
+            | (lambda x: SocialPost(**x)) # Convertimos el Diccionario a Objeto Pydantic para no romper la UI
+        )
+
+        # F. Cadena de corrección de reglas de marca
+        repair_prompt = ChatPromptTemplate.from_template(REPAIR_PROMPT, partial_variables=_profile_variables(tenant))
+        repair_chain = repair_prompt | llm | JsonOutputParser()
+
+        return TenantChains(tenant=tenant, chain=chain, repair_chain=repair_chain)
+
+
+# --- 4. POOL DEL PROCESO ---
+# Un único pool por proceso, compartido por todas las sesiones de Streamlit.
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Devuelve (y crea la primera vez) el pool compartido del proceso."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ChainPool(load_settings())
+        return _pool
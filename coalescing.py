@@ -0,0 +1,330 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# --- COALESCENCIA Y LIMITACIÓN DE PETICIONES ENTRE SESIONES ---
+# Todas las sesiones de Streamlit comparten proceso (y pool de cadenas), pero cada "Generar"
+# llamaba al LLM por su cuenta. Este módulo añade tres piezas en memoria:
+#   1. SingleFlight: si ya hay una petición idéntica en curso, las demás esperan su resultado.
+#   2. TokenBucket: límite global de llamadas por minuto hacia OpenRouter.
+#   3. FairScheduler: cola justa por sesión (round-robin), para que una sesión que lanza
+#      muchas peticiones no deje sin turno a las demás. Informa de la posición en cola.
+
+
+class _LeaderAborted(Exception):
+    """La ejecución compartida se interrumpió por algo propio de la sesión líder."""
+
+
+class SingleFlight:
+    """Une las llamadas concurrentes con la misma clave en una sola ejecución."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _forget(self, key):
+        # Se retira la clave antes de publicar el resultado: quien reintente tras un
+        # _LeaderAborted ya no encuentra la ejecución abortada y puede convertirse en líder
+        with self._lock:
+            del self._calls[key]
+
+    def do(self, key, fn, on_join=None):
+        """
+        Ejecuta fn() una sola vez por clave mientras esté en curso.
+        Las llamadas que llegan mientras tanto reciben el mismo resultado (o la misma Exception).
+        on_join() se invoca si esta llamada se une a una ejecución ya en curso.
+        Las BaseException del líder (RerunException/StopException de Streamlit cuando su
+        usuario toca un widget o cierra la pestaña) no se reenvían: son de su sesión, así que
+        las demás reintentan y una de ellas pasa a ser la nueva líder.
+        """
+        joined = False
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = Future()
+
+            if not leader:
+                if on_join and not joined:
+                    on_join()
+                joined = True
+                try:
+                    return call.result()
+                except _LeaderAborted:
+                    continue
+
+            try:
+                result = fn()
+            except Exception as e:
+                self._forget(key)
+                call.set_exception(e)
+                raise
+            except BaseException:
+                self._forget(key)
+                call.set_exception(_LeaderAborted())
+                raise
+            self._forget(key)
+            call.set_result(result)
+            return result
+
+
+class TokenBucket:
+    """Cubo de tokens: `rate` tokens por segundo con ráfagas de hasta `capacity` (rate <= 0 = sin límite)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Consume un token si hay. Devuelve 0 si lo consigue o los segundos hasta el siguiente."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Espera hasta conseguir un token."""
+        while True:
+            wait_s = self.try_acquire()
+            if wait_s == 0:
+                return
+            time.sleep(wait_s)
+
+
+class FairScheduler:
+    """
+    Cola justa entre sesiones: atiende un ticket de cada sesión por turno (round-robin),
+    con un máximo de ejecuciones simultáneas y sujeto al TokenBucket global.
+    """
+
+    def __init__(self, bucket, max_concurrent, poll_interval=0.5):
+        self.bucket = bucket
+        self.max_concurrent = max_concurrent
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # session_id -> deque de tickets
+        self._active = 0
+
+    def _position(self, session_id, ticket):
+        # Orden de servicio: ronda 0 = primer ticket de cada sesión, ronda 1 = segundo...
+        # Las sesiones que van antes en la rueda también pasan en la ronda del ticket.
+        round_index = self._queues[session_id].index(ticket)
+        ahead = round_index
+        before = True
+        for other_id, other in self._queues.items():
+            if other_id == session_id:
+                before = False
+                continue
+            ahead += min(len(other), round_index + 1 if before else round_index)
+        return ahead + 1
+
+    def _is_next(self, session_id, ticket):
+        head_id = next(iter(self._queues))
+        return head_id == session_id and self._queues[session_id][0] is ticket
+
+    def _dequeue(self, session_id):
+        # Turno servido: la sesión pasa al final de la rueda (o sale si no le quedan tickets)
+        queue = self._queues.pop(session_id)
+        queue.popleft()
+        if queue:
+            self._queues[session_id] = queue
+
+    def run(self, session_id, fn, on_wait=None):
+        """
+        Espera turno y ejecuta fn(). on_wait(posición) se llama mientras la petición espera
+        (posición 1 = la siguiente en salir), fuera del lock para poder actualizar la UI.
+        """
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+
+        served = False
+        try:
+            while True:
+                with self._cond:
+                    timeout = self.poll_interval
+                    if self._is_next(session_id, ticket) and self._active < self.max_concurrent:
+                        wait_s = self.bucket.try_acquire()
+                        if wait_s == 0:
+                            self._dequeue(session_id)
+                            self._active += 1
+                            served = True
+                            break
+                        timeout = min(wait_s, self.poll_interval)
+                    position = self._position(session_id, ticket)
+                if on_wait:
+                    on_wait(position)
+                with self._cond:
+                    self._cond.wait(timeout)
+        finally:
+            if not served:
+                # Error o cancelación mientras esperaba: liberamos el hueco en la cola
+                with self._cond:
+                    queue = self._queues.get(session_id)
+                    if queue is not None and ticket in queue:
+                        queue.remove(ticket)
+                        if not queue:
+                            del self._queues[session_id]
+                    self._cond.notify_all()
+
+        try:
+            return fn()
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+
+class RequestGate:
+    """
+    Punto de entrada único para las generaciones: primero coalescencia (peticiones idénticas
+    no hacen cola), después cola justa y límite de tasa para la que realmente se ejecuta.
+    """
+
+    def __init__(self, rate_per_minute, burst, max_concurrent):
+        self.flight = SingleFlight()
+        self.scheduler = FairScheduler(TokenBucket(rate_per_minute / 60, burst), max_concurrent)
+
+    def run(self, key, session_id, fn, on_wait=None, on_join=None):
+        return self.flight.do(key, lambda: self.scheduler.run(session_id, fn, on_wait), on_join=on_join)
+
+    def acquire_extra(self):
+        """
+        Consume un token más del límite global para una llamada adicional al LLM dentro de
+        una generación ya en curso (p. ej. la corrección de reglas de marca).
+        """
+        self.scheduler.bucket.acquire()
+
+
+# --- SIMULACIÓN DE CONCURRENCIA ---
+# Uso: python coalescing.py
+# Lanza muchas sesiones simuladas a la vez y comprueba coalescencia, límite de tasa y equidad.
+if __name__ == "__main__":
+    calls = []
+    calls_lock = threading.Lock()
+
+    def fake_llm(name):
+        def call():
+            with calls_lock:
+                calls.append((name, time.monotonic()))
+            time.sleep(0.05)
+            return f"copy:{name}"
+        return call
+
+    gate = RequestGate(rate_per_minute=600, burst=3, max_concurrent=2)
+    results = {}
+    max_position = {}
+
+    def session(session_id, key):
+        def on_wait(position):
+            max_position[session_id] = max(max_position.get(session_id, 0), position)
+        results[session_id] = gate.run(key, session_id, fake_llm(key), on_wait=on_wait)
+
+    # 20 sesiones piden el mismo anuncio de concierto + 10 sesiones piden cosas distintas
+    threads = [threading.Thread(target=session, args=(f"s{i}", "concierto-madrid")) for i in range(20)]
+    threads += [threading.Thread(target=session, args=(f"u{i}", f"post-{i}")) for i in range(10)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+
+    assert all(results[f"s{i}"] == "copy:concierto-madrid" for i in range(20))
+    assert len(calls) == 11, calls  # 1 para las 20 idénticas + 10 distintas
+    # Con 10 tokens/s y ráfaga de 3, las 11 llamadas necesitan al menos ~0.8 s
+    assert elapsed >= 0.7, elapsed
+    print(f"OK: 30 sesiones -> {len(calls)} llamadas al LLM en {elapsed:.2f}s; "
+          f"posición máxima en cola: {max(max_position.values(), default=0)}")
+
+    # Equidad: una sesión con 5 peticiones no bloquea a otras 3 sesiones que llegan después
+    calls.clear()
+    order = []
+    greedy_gate = RequestGate(rate_per_minute=6000, burst=1, max_concurrent=1)
+
+    def queued(session_id, key):
+        greedy_gate.run(key, session_id, fake_llm(key))
+        order.append(session_id)
+
+    blocker = threading.Thread(target=queued, args=("greedy", "g0"))
+    blocker.start()
+    time.sleep(0.01)
+    threads = [threading.Thread(target=queued, args=("greedy", f"g{i}")) for i in range(1, 5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.01)
+    others = [threading.Thread(target=queued, args=(f"o{i}", f"o{i}")) for i in range(3)]
+    for t in others:
+        t.start()
+    for t in [blocker] + threads + others:
+        t.join()
+    # Las otras sesiones se atienden antes de que la sesión acaparadora termine su cola
+    assert order.index("o2") < len(order) - 1, order
+    print(f"OK: orden de servicio justo {order}")
+
+    # Límite desactivado (LLM_RATE_PER_MINUTE=0): más allá de la ráfaga no hay espera ni error
+    unlimited = RequestGate(rate_per_minute=0, burst=5, max_concurrent=4)
+    assert [unlimited.run(f"k{i}", "s", lambda: i) for i in range(10)] == list(range(10))
+    unlimited.acquire_extra()
+
+    # La corrección (acquire_extra) consume un token más: 3 tokens de ráfaga = 1 generación
+    # con corrección + 1 sin ella; la tercera espera a que se repongan
+    extra_gate = RequestGate(rate_per_minute=60, burst=3, max_concurrent=1)
+    start = time.monotonic()
+    extra_gate.run("a", "s", lambda: extra_gate.acquire_extra())
+    extra_gate.run("b", "s", lambda: None)
+    fast = time.monotonic() - start
+    extra_gate.run("c", "s", lambda: None)
+    assert fast < 0.5 and time.monotonic() - start >= 0.9, (fast, time.monotonic() - start)
+    print("OK: sin límite con rate 0; la corrección cuenta como otra llamada")
+
+    # Interrupción del líder: simula el RerunException de Streamlit (hereda de BaseException).
+    # Las demás sesiones no lo heredan: reintentan y una de ellas genera el copy.
+    class FakeRerun(BaseException):
+        pass
+
+    calls.clear()
+    flight = SingleFlight()
+    outcomes = {}
+    leader_started = threading.Event()
+
+    def aborted_leader():
+        leader_started.set()
+        time.sleep(0.05)
+        raise FakeRerun()
+
+    def leader_session():
+        try:
+            flight.do("concierto-bilbao", aborted_leader)
+        except FakeRerun:
+            outcomes["leader"] = "rerun"
+
+    def follower(session_id):
+        try:
+            outcomes[session_id] = flight.do("concierto-bilbao", fake_llm("concierto-bilbao"))
+        except BaseException as e:
+            outcomes[session_id] = repr(e)
+
+    leader_thread = threading.Thread(target=leader_session)
+    leader_thread.start()
+    leader_started.wait()
+    followers = [threading.Thread(target=follower, args=(f"f{i}",)) for i in range(5)]
+    for t in followers:
+        t.start()
+    for t in [leader_thread] + followers:
+        t.join()
+    assert outcomes.pop("leader") == "rerun"
+    assert all(v == "copy:concierto-bilbao" for v in outcomes.values()), outcomes
+    assert len(calls) == 1, calls  # un seguidor se convierte en líder; el resto se une a él
+    print(f"OK: líder interrumpido -> {len(outcomes)} seguidores reintentan con {len(calls)} llamada al LLM")
@@ -1,8 +1,7 @@
 import os
-import time
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
-from qdrant_client import QdrantClient
+from chain_pool import DEFAULT_TENANT, get_pool
+from warmup import Warmup
 
 # --- CONFIGURACIÓN VISUAL ---
 # Códigos ANSI para dar color a los mensajes en la terminal
@@ -19,76 +18,21 @@ def print_status(component, status, message=""):
 print(f"{YELLOW}--- DIAGNÓSTICO DE SISTEMA: ARROJO CONTENT GENERATOR ---{RESET}\n")
 
 # --- 1. CARGA DE VARIABLES Y CONFIGURACIÓN ---
+# Usamos exactamente la misma configuración (.env) que la app y el calentamiento del contenedor.
 load_dotenv()
 
-api_key = os.getenv("OPENROUTER_API_KEY")
-qdrant_url = os.getenv("QDRANT_URL")
-qdrant_key = os.getenv("QDRANT_API_KEY")
+pool = get_pool()
+settings = pool.settings
+tenant_id = os.getenv("DEBUG_TENANT", DEFAULT_TENANT)
 
-# Validamos y limpiamos la URL de Qdrant para evitar errores de formato
-if qdrant_url and qdrant_url.endswith("/"):
-    qdrant_url = qdrant_url[:-1]
-    print(f"{YELLOW}Aviso: Se eliminó la barra final '/' de QDRANT_URL para normalizar la dirección.{RESET}")
+print(f"URL Objetivo: {settings.qdrant_url} (puerto {settings.qdrant_port}, HTTPS={settings.qdrant_https})")
+print(f"Colección: {pool.tenants[tenant_id].collection} | Embeddings: {settings.embedding_model}")
 
-print(f"URL Objetivo: {qdrant_url}")
+# --- 2. PRUEBA DE DEPENDENCIAS (CADENA, QDRANT, EMBEDDINGS, BÚSQUEDA, AGENDA) ---
+print(f"\n{YELLOW}--- VERIFICANDO DEPENDENCIAS ---{RESET}")
 
-# --- 2. PRUEBA DE CONEXIÓN A QDRANT ---
-print(f"\n{YELLOW}--- VERIFICANDO CONEXIÓN A BASE DE DATOS VECTORIAL ---{RESET}")
-
-try:
-    # Configuramos el cliente explícitamente para HTTPS (Puerto 443)
-    # Esto asegura la conexión segura con Easypanel.
-    client = QdrantClient(
-        url=qdrant_url,
-        port=443,        
-        https=True,      
-        api_key=qdrant_key if qdrant_key else None,
-        timeout=10
-    )
-    
-    # Intentamos listar las colecciones para confirmar que la autenticación funciona
-    collections = client.get_collections()
-    names = [c.name for c in collections.collections]
-    
-    # Verificamos si existe nuestra colección principal 'arrojo'
-    if "arrojo" in names:
-        print_status("CONEXIÓN", "OK", f"¡Conexión establecida! Colecciones encontradas: {names}")
-    else:
-        print_status("CONEXIÓN", "WARNING", f"Conectado, pero NO encontramos la colección 'arrojo'. Disponibles: {names}")
-
-except Exception as e:
-    print_status("CONEXIÓN", "ERROR", f"Fallo crítico al conectar: {str(e)}")
-
-# --- 3. PRUEBA DE FLUJO RAG (EMBEDDINGS + BÚSQUEDA) ---
-print(f"\n{YELLOW}--- VERIFICANDO GENERACIÓN Y BÚSQUEDA VECTORIAL ---{RESET}")
-
-try:
-    # Inicializamos el modelo de Embeddings (Qwen)
-    # Es vital que sea el mismo modelo usado para subir los datos.
-    embeddings = OpenAIEmbeddings(
-        model="qwen/qwen3-embedding-8b",
-        openai_api_key=api_key,
-        openai_api_base=os.getenv("OPENROUTER_BASE_URL")
-    )
-    
-    print("Generando vector de prueba (esto verifica la conexión con OpenRouter)...")
-    query_vector = embeddings.embed_query("test de diagnóstico")
-    print(f"Vector generado correctamente. Dimensión: {len(query_vector)}")
-
-    # Ejecutamos una búsqueda real en Qdrant para validar que devuelve datos
-    hits = client.search(
-        collection_name="arrojo",
-        query_vector=query_vector,
-        limit=1
-    )
-    
-    if hits:
-        print_status("RAG", "OK", f"¡Búsqueda exitosa! Score de similitud: {hits[0].score}")
-        print(f"Datos recuperados (Payload): {hits[0].payload}")
-    else:
-        print_status("RAG", "WARNING", "La búsqueda funcionó, pero la colección parece estar vacía (0 resultados).")
-
-except AttributeError:
-    print_status("RAG", "ERROR", "Error de compatibilidad. Posible librería desactualizada.")
-except Exception as e:
-    print_status("RAG", "ERROR", f"Fallo durante la prueba de búsqueda: {str(e)}")
\ No newline at end of file
+warmup = Warmup(pool, tenant_id)
+for name, (ok, detail) in warmup.run_once().items():
+    latency = warmup.stats[name].snapshot()["last_ms"]
+    timing = f"({latency} ms)" if latency is not None else ""
+    print_status(name.upper(), "OK" if ok else "ERROR", f"{detail} {timing}")
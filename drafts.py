@@ -0,0 +1,242 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from agenda import fetch_agenda_csv, gig_key, parse_agenda
+from chain_pool import get_pool
+from generation import generate_post, generation_key
+
+logger = logging.getLogger(__name__)
+
+# --- PREGENERACIÓN DE BORRADORES DE CONCIERTOS ---
+# La agenda ya contiene todos los conciertos futuros, así que no hace falta esperar al
+# momento de publicar para generar su copy. En horas valle (PREGEN_HOURS) un hilo en segundo
+# plano lee la agenda, genera en lotes un borrador por concierto y plataforma configurada
+# (PREGEN_TARGETS) y lo guarda en una base SQLite local indexada por concierto.
+# La agenda se relee cada PREGEN_INTERVAL también fuera de la franja valle (desde la caché
+# del proceso, que se refresca cada AGENDA_TTL): si la fila del concierto cambia en la hoja
+# (hash distinto) o desaparece, sus borradores se invalidan. El prompt usa la fecha de hoy
+# para escribir "mañana" o "este viernes", así que un borrador solo vale el día en que se
+# generó y se regenera cada noche; por eso solo se generan los conciertos de los próximos
+# PREGEN_DAYS_AHEAD días.
+# Al enviar el formulario con la misma fecha/ciudad/sala (y el enlace de la agenda) se
+# ofrece al instante.
+
+# Valores con los que se pregenera (los mismos que usa el formulario por defecto)
+CONCERT_REASON = "1. Concierto"
+DEFAULT_TONE = "Canalla (Default)"
+DEFAULT_LINK_TYPE = "Venta de Entradas"
+# Las pregeneraciones entran en la cola justa como una sesión más, sin adelantar a nadie
+PREGEN_SESSION = "pregeneracion"
+# La base es una caché: si cambia el esquema se descarta y se vuelve a generar
+SCHEMA_VERSION = 2
+
+
+def _today_start():
+    """Marca de tiempo de las 00:00 de hoy (hora local): los borradores anteriores caducan."""
+    return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class DraftStore:
+    """Almacén local de borradores: un post por (tenant, concierto, plataforma, formato)."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS drafts")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS drafts (
+                    tenant TEXT NOT NULL,
+                    gig_key TEXT NOT NULL,
+                    platform TEXT NOT NULL,
+                    media_type TEXT NOT NULL,
+                    row_hash TEXT NOT NULL,
+                    link TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    post TEXT NOT NULL,
+                    PRIMARY KEY (tenant, gig_key, platform, media_type)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_drafts_gig ON drafts (tenant, gig_key)")
+
+    def get(self, tenant_id, key, platform, media_type):
+        """Devuelve (post, enlace_de_la_agenda) del borrador generado hoy, o None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT post, link FROM drafts WHERE tenant = ? AND gig_key = ? AND platform = ? "
+                "AND media_type = ? AND created_at >= ?",
+                (tenant_id, key, platform, media_type, _today_start()),
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def existing(self, tenant_id):
+        """Devuelve {(gig_key, platform, media_type): row_hash} de los borradores de hoy del tenant."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT gig_key, platform, media_type, row_hash FROM drafts WHERE tenant = ? AND created_at >= ?",
+                (tenant_id, _today_start()),
+            ).fetchall()
+        return {(key, platform, media_type): row_hash for key, platform, media_type, row_hash in rows}
+
+    def put(self, tenant_id, gig, platform, media_type, post):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO drafts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (tenant_id, gig.key, platform, media_type, gig.row_hash, gig.link, time.time(),
+                 json.dumps(post, ensure_ascii=False)),
+            )
+
+    def invalidate(self, tenant_id, gigs):
+        """
+        Elimina los borradores de conciertos que han cambiado o ya no están en la agenda,
+        y los de días anteriores (sus fechas relativas ya no son correctas).
+        """
+        current = {gig.key: gig.row_hash for gig in gigs}
+        stale = [
+            (tenant_id, key, platform, media_type)
+            for (key, platform, media_type), row_hash in self.existing(tenant_id).items()
+            if current.get(key) != row_hash
+        ]
+        with self._lock, self._conn:
+            if stale:
+                self._conn.executemany(
+                    "DELETE FROM drafts WHERE tenant = ? AND gig_key = ? AND platform = ? AND media_type = ?",
+                    stale,
+                )
+            expired = self._conn.execute(
+                "DELETE FROM drafts WHERE tenant = ? AND created_at < ?", (tenant_id, _today_start())
+            ).rowcount
+        return len(stale) + expired
+
+
+class PregenScheduler:
+    """Genera en horas valle los borradores que faltan para los próximos conciertos."""
+
+    def __init__(self, pool, store):
+        self.pool = pool
+        self.store = store
+        self.settings = pool.settings
+
+    def is_off_peak(self, now=None):
+        start, end = self.settings.pregen_hours
+        hour = (now or datetime.now()).hour
+        # La franja puede cruzar la medianoche (p. ej. 23-6)
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def pending_jobs(self, tenant_id, gigs, today=None):
+        """Combinaciones (concierto, plataforma, formato) sin borrador vigente dentro de la ventana."""
+        today = today or datetime.now().date()
+        horizon = today + timedelta(days=self.settings.pregen_days_ahead)
+        existing = self.store.existing(tenant_id)
+        return [
+            (gig, platform, media_type)
+            for gig in gigs
+            if gig.date <= horizon
+            for platform, media_type in self.settings.pregen_targets
+            if existing.get((gig.key, platform, media_type)) != gig.row_hash
+        ]
+
+    def _generate(self, tenant_id, gig, platform, media_type):
+        specific_data = {
+            "date": gig.date.strftime("%d/%m"),
+            "city": gig.city,
+            "venue": gig.venue,
+            "link_type": DEFAULT_LINK_TYPE,
+            "link_url": gig.link,
+        }
+        request = (tenant_id, platform, media_type, DEFAULT_TONE, CONCERT_REASON, specific_data, "", "")
+        # Pasa por la misma puerta que la UI: límite de tasa global y coalescencia con
+        # un usuario que esté generando justo el mismo concierto
+        post = self.pool.gate.run(generation_key(*request), PREGEN_SESSION, lambda: generate_post(*request))
+        self.store.put(tenant_id, gig, platform, media_type, post)
+
+    def run_once(self, tenant_id):
+        """
+        Sincroniza los borradores de un tenant con su agenda: invalida siempre y, solo en
+        horas valle, genera los que faltan. Devuelve cuántos se generaron.
+        """
+        tenant = self.pool.tenants[tenant_id]
+        if not tenant.agenda_url:
+            return 0
+        gigs = parse_agenda(fetch_agenda_csv(tenant.agenda_url))
+        self.store.invalidate(tenant_id, gigs)
+        if not self.is_off_peak():
+            return 0
+        jobs = self.pending_jobs(tenant_id, gigs)
+
+        generated = 0
+        batch_size = self.settings.pregen_batch_size
+        with ThreadPoolExecutor(max_workers=batch_size) as executor:
+            for i in range(0, len(jobs), batch_size):
+                # Si se acaba la franja valle a mitad, el resto queda para la siguiente noche
+                if not self.is_off_peak():
+                    break
+                batch = jobs[i:i + batch_size]
+                futures = [executor.submit(self._generate, tenant_id, *job) for job in batch]
+                for (gig, platform, _), future in zip(batch, futures):
+                    try:
+                        future.result()
+                        generated += 1
+                    except Exception as e:
+                        logger.warning("No se pudo pregenerar %s (%s): %s", gig.key, platform, e)
+        return generated
+
+    def run_forever(self):
+        if not self.settings.pregen_targets:
+            return
+        while True:
+            # La invalidación va en cada ciclo: una fila editada a mediodía no puede seguir
+            # sirviendo su borrador antiguo hasta la siguiente franja valle
+            for tenant_id in self.pool.tenants:
+                try:
+                    self.run_once(tenant_id)
+                except Exception as e:
+                    logger.warning("Fallo en la pregeneración de '%s': %s", tenant_id, e)
+            time.sleep(self.settings.pregen_interval)
+
+
+# --- ALMACÉN Y PLANIFICADOR DEL PROCESO ---
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Devuelve (y crea la primera vez) el almacén de borradores compartido del proceso."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DraftStore(get_pool().settings.drafts_db)
+        return _store
+
+
+def find_draft(tenant_id, specific_data, platform, media_type):
+    """
+    Busca el borrador pregenerado que corresponde a los datos del formulario de concierto.
+    Solo vale si el enlace es el mismo con el que se generó: tipo por defecto y URL vacía
+    o igual a la de la agenda.
+    """
+    if specific_data.get("link_type", DEFAULT_LINK_TYPE) != DEFAULT_LINK_TYPE:
+        return None
+    key = gig_key(specific_data.get("date"), specific_data.get("city"), specific_data.get("venue"))
+    found = get_store().get(tenant_id, key, platform, media_type)
+    if not found:
+        return None
+    post, link = found
+    link_url = (specific_data.get("link_url") or "").strip()
+    if link_url and link_url != link:
+        return None
+    return post
+
+
+def start_scheduler():
+    """Arranca el planificador de pregeneración en un hilo en segundo plano."""
+    scheduler = PregenScheduler(get_pool(), get_store())
+    threading.Thread(target=scheduler.run_forever, name="pregeneracion", daemon=True).start()
+    return scheduler
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime
+
+from agenda import fetch_agenda_data
+from brand_rules import autofix_post
+from chain_pool import DEFAULT_TENANT, get_pool
+
+logger = logging.getLogger(__name__)
+
+# --- GENERACIÓN DE COPYS ---
+# Pipeline completo independiente de la interfaz: cadena RAG + LLM del artista, filtro de
+# formato por plataforma y REGLAS DE ORO. Lo usan la UI (app.py) y la pregeneración de
+# borradores en segundo plano (drafts.py).
+
+# --- FUNCIÓN DE LIMPIEZA DE FORMATO (FILTRO DE SEGURIDAD) ---
+def clean_format_for_platform(text, platform):
+    """
+    Elimina Markdown y gestiona enlaces según las restricciones técnicas de la red social.
+    Esto actúa como una barrera de seguridad por si el LLM ignora las instrucciones.
+    """
+    # 1. Definir si la plataforma soporta Markdown (Solo WhatsApp lo soporta bien)
+    supports_markdown = "WhatsApp" in platform
+    
+    # 2. Definir si la plataforma soporta enlaces clicables en el cuerpo del texto
+    clickable_links = any(p in platform for p in ["Facebook", "WhatsApp", "YouTube", "Twitter", "X"])
+
+    clean_text = text
+
+    # --- LIMPIEZA DE ESTILOS (Negrita, Cursiva) ---
+    if not supports_markdown:
+        # Eliminar negritas (**texto** o __texto__) -> texto
+        clean_text = re.sub(r'\*\*(.*?)\*\*', r'\1', clean_text)
+        clean_text = re.sub(r'__(.*?)__', r'\1', clean_text)
+        # Eliminar cursivas (*texto* o _texto_) -> texto
+        clean_text = re.sub(r'\*(.*?)\*', r'\1', clean_text)
+        clean_text = re.sub(r'_(.*?)_', r'\1', clean_text)
+        # Eliminar encabezados Markdown (# Titulo)
+        clean_text = re.sub(r'^#+\s+', '', clean_text, flags=re.MULTILINE)
+
+    # --- GESTIÓN INTELIGENTE DE ENLACES ---
+    # Patrón para encontrar enlaces markdown: [Texto Ancla](URL)
+    link_pattern = r'\[(.*?)\]\((.*?)\)'
+    
+    def link_replacer(match):
+        anchor_text = match.group(1)
+        url = match.group(2)
+        
+        if clickable_links:
+            # En Facebook/YouTube: Convertimos "[Entradas](url)" en "Entradas (url)"
+            # O si prefieres solo la URL: return f"{anchor_text}: {url}"
+            return f"{anchor_text} ({url})"
+        else:
+            # En Instagram/TikTok: La URL no sirve de nada. 
+            # Convertimos "[Entradas](url)" en "Entradas".
+            return anchor_text
+
+    clean_text = re.sub(link_pattern, link_replacer, clean_text)
+
+    return clean_text
+
+# --- LÓGICA DE OPTIMIZACIÓN (CON REGLAS DE FORMATO) ---
+def get_optimization_instruction(platform, media_type):
+    """
+    Devuelve la instrucción técnica específica basada en la combinación
+    de Plataforma y Tipo de Medio seleccionados.
+    """
+    
+    # Diccionario de reglas basado en documentación técnica 2026
+    # Clave compuesta: "PLATAFORMA|TIPO_MEDIO"
+    # Usamos '|' como separador para evitar conflictos.
+
+    instructions = {
+        # CASO: Instagram (Feed) + Carrusel
+        "Instagram (Feed)|Carrusel": """
+        OPTIMIZACIÓN: Estructura de Carrusel Educativo.
+        * Formato técnico: PROHIBIDO usar Markdown (**negrita**). Usa MAYÚSCULAS para resaltar.
+        * Enlaces: NO pongas URLs. Escribe "Link en Bio" o "Comenta FUEGO".
+        * Campo 'hashtags': Usa 5-10 hashtags clásicos (#Rock #Musica).
+        * Objetivo: Maximizar 'Guardados' (Saves).
+        * Estructura: Genera texto para 8-10 diapositivas secuenciales.
+        * Slide 1: Gancho visual de alto contraste (<10 palabras).
+        * Cuerpo: Una idea por slide. Usa listas y síntesis.
+        * Slide Final: CTA explícito para GUARDAR el post.
+        * Caption: Estilo micro-blogging. Primera frase debe ser un gancho SEO.
+        """,
+
+        # CASO: Instagram (Stories) - Vídeo/Foto
+        "Instagram (Stories)|Vídeo": """
+        OPTIMIZACIÓN: Retención y Fidelización.
+        * Tono: Auténtico, 'crudo' y conversacional.
+        * Interacción: DEBES sugerir explícitamente qué Sticker usar (Encuesta, Caja de Preguntas, Tu Turno).
+        * Duración/Texto: Breve, directo.
+        * Campo 'hashtags': DEBE ESTAR VACÍO (cadena vacía ""). No uses hashtags en stories.
+        * Formato: Texto plano.
+        * Enlaces: NO escribas la URL. Indica "Usa el Sticker de Enlace".
+        * Objetivo: Generar respuesta directa (DM) o toque en sticker.
+        """,
+        "Instagram (Stories)|Foto": """
+        OPTIMIZACIÓN: Retención y Fidelización.
+        * Tono: Auténtico, 'crudo' y conversacional.
+        * Interacción: DEBES sugerir explícitamente qué Sticker usar (Encuesta, Caja de Preguntas, Tu Turno).
+        * Duración/Texto: Breve, directo.
+        * Campo 'hashtags': DEBE ESTAR VACÍO (cadena vacía ""). No uses hashtags en stories.
+        * Formato: Texto plano.
+        * Enlaces: NO escribas la URL. Indica "Usa el Sticker de Enlace".
+        * Objetivo: Generar respuesta directa (DM) o toque en sticker.
+        """,
+        
+        # CASO: Instagram (Feed) - Genérico (Si existiera vídeo en feed)
+        "Instagram (Feed)|Vídeo": """
+        OPTIMIZACIÓN: Reels / Feed Video.
+        * Formato: Texto plano estricto (Sin negritas). Usa Emojis y SALTOS DE LÍNEA.
+        * Enlaces: PROHIBIDO poner URLs en el texto. Usa "Link en la Bio".
+        * CTA: Pide que visiten el perfil.
+        * Campo 'hashtags': Usa hashtags mixtos (Nicho + Amplios) con #.
+        """,
+
+        # CASO: TikTok + Vídeo
+        "TikTok|Vídeo": """
+        OPTIMIZACIÓN: Motor de Búsqueda y Retención (SEO + Watch Time).
+        * Gancho: Escribe un gancho (visual/auditivo) para los primeros 2 segundos. Debe ser disruptivo.
+        * Texto en Pantalla: Sugiere keywords para poner sobre el vídeo (para el OCR de TikTok).
+        * Campo 'hashtags': Usa la regla 3-3-3 (3 amplios, 3 nicho, 3 específicos o #Nicho #Viral #Marca).
+        * Formato: Texto plano estricto.
+        * Enlaces: NO pongas URLs. "Link en perfil".
+        * SEO: La descripción debe actuar como meta-data. Incluye palabras clave long-tail naturales en el texto.
+        """,
+
+        # CASO: Facebook + Vídeo
+        "Facebook|Vídeo": """
+        OPTIMIZACIÓN: Discovery Engine.
+        * Formato: Tratamiento de Reel unificado en Texto plano.
+        * Narrativa: Estructura de historia completa (Inicio-Nudo-Desenlace) para retener +90 segundos.
+        * Tono: Más universal/emocional, menos jerga Gen Z.
+        * Enlaces: SÍ puedes poner URLs completas al final del post (son clicables).
+        * Campo 'hashtags': Máximo 1 (#ArrojoRock) o ninguno. Facebook penaliza el exceso.
+        """,
+
+        # CASO: YouTube Shorts + Vídeo
+        "YouTube (Shorts)|Vídeo": """
+        OPTIMIZACIÓN: Tráfico y Suscripción.
+        * Loop: El guion debe terminar de forma que enlace con el principio (Loop perfecto).
+        * CTA: Enfocado a 'Suscribirse' o 'Ver vídeo relacionado'.
+        * SEO: Título de <60 caracteres cargado de intención de búsqueda.
+        * Formato: Texto plano.
+        * Enlaces: NO en el título. Ponlos en comentario fijado o descripción.
+        * Campo 'hashtags': Palabras clave (Tags) separadas por COMAS sin almohadilla (concierto, rock, musica en vivo, rock español, banda emergente, madrid). NO uses #.
+        """,
+
+        # CASO: YouTube (Video) + Vídeo
+        "YouTube (Video)|Vídeo": """
+        OPTIMIZACIÓN: SEO y Key Moments.
+        * Estructura: Divide el guion en 'Capítulos' claros con marcas de tiempo sugeridas.
+        * Descripción: Primeros 150 caracteres con la keyword principal.
+        * Título: Optimizado para CTR (Click Through Rate).
+        * Formato: Texto plano.
+        * Enlaces: NO en el título. Ponlos en comentario fijado o descripción.
+        * Campo 'hashtags': Palabras clave (Tags) separadas por COMAS sin almohadilla (concierto, rock, musica en vivo, rock español, banda emergente, madrid). NO uses #.
+        """,
+
+        # CASO: WhatsApp Channel + Solo Texto
+        "WhatsApp Channel|Solo Texto": """
+        OPTIMIZACIÓN: Boletín de Alta Fricción.
+        * Longitud: ESTRICTAMENTE menos de 500 caracteres.
+        * Interacción: Pide reacción con Emojis específicos (ej: 'Pulsa 🔥').
+        * Prohibido: No usar hashtags. No pedir comentarios (es unidireccional).
+        * Formato: USA Markdown de WhatsApp (*negrita* para títulos, _cursiva_).
+        * Enlaces: URLs completas y clicables.
+        * Campo 'hashtags': DEBE ESTAR VACÍO (cadena vacía ""). WhatsApp no usa etiquetas.
+        """
+    }
+
+    # Construir clave de búsqueda
+    key = f"{platform}|{media_type}"
+    
+    # Retornar instrucción específica o un fallback genérico si la combinación no tiene regla estricta
+    return instructions.get(key, f"""
+    OPTIMIZACIÓN: Estándar para {platform}.
+    * FORMATO: Adaptado a {media_type}. Si es Instagram/TikTok -> SOLO TEXTO PLANO (Sin negritas). Si es WhatsApp -> Markdown OK.
+    * ENLACES: Si es Instagram/TikTok -> "Link en Bio". Si es Facebook/YT -> URL completa al final.
+    * Objetivo: Maximizar engagement según las mejores prácticas generales de la plataforma.
+    * CTA: Claro y directo.
+    * Campo 'hashtags': Si es YouTube -> Keywords separadas por comas. Si es WhatsApp/Stories -> Dejar vacío. Resto -> Hashtags con #.
+    """)
+
+# --- CADENAS Y REGLAS DE MARCA ---
+
+def get_chain(tenant_id=DEFAULT_TENANT):
+    """
+    Devuelve las cadenas (generación + corrección) del artista seleccionado.
+    El pool es compartido por todo el proceso: mantiene las conexiones abiertas, comparte
+    clientes entre artistas y construye la cadena de cada uno la primera vez que se usa.
+    """
+    return get_pool().get(tenant_id)
+
+def enforce_brand_rules(text, hashtags, platform, tenant_chains):
+    """
+    Aplica las REGLAS DE ORO sobre el copy limpio.
+    1. Arregla en local lo mecánico (emojis, hashtags, longitud).
+    2. Solo si quedan infracciones no mecánicas, pide UNA corrección al LLM y vuelve a validar.
+    Devuelve (texto, hashtags, infracciones_pendientes).
+    Si la corrección falla, se devuelve el copy arreglado en local con las infracciones
+    como avisos: el post generado sigue siendo utilizable.
+    """
+    profile = tenant_chains.tenant.prompt_profile
+    text, hashtags, pending = autofix_post(text, hashtags, platform, profile.fan_word, profile.banned_cliches)
+    if not pending:
+        return text, hashtags, pending
+
+    # La corrección es otra llamada a OpenRouter: también cuenta para LLM_RATE_PER_MINUTE
+    get_pool().gate.acquire_extra()
+    try:
+        repaired = tenant_chains.repair_chain.invoke({
+            "violations": "\n".join(f"- {v.message}" for v in pending),
+            "platform": platform,
+            "copy_text": text
+        })
+    except Exception as e:
+        logger.warning("Falló la corrección de reglas de marca: %s", e)
+        return text, hashtags, pending
+    if not isinstance(repaired, dict) or not isinstance(repaired.get("copy_text", text), str):
+        return text, hashtags, pending
+    # La corrección vuelve a pasar por el filtro de formato y por el validador
+    text = clean_format_for_platform(repaired.get("copy_text", text), platform)
+    return autofix_post(text, hashtags, platform, profile.fan_word, profile.banned_cliches)
+
+# --- PIPELINE COMPLETO ---
+
+def generate_post(tenant_id, platform, media_type, tone, reason, specific_data, visual_context, user_instructions):
+    """
+    Ejecuta la generación completa (RAG + LLM + filtros) y devuelve un diccionario
+    serializable con el resultado, listo para guardarse en st.session_state.
+    """
+    # 1. Obtener las cadenas de LangChain del artista
+    tenant_chains = get_chain(tenant_id)
+    # 2. Obtener datos auxiliares
+    # Descargar datos de agenda en tiempo real
+    agenda_text = fetch_agenda_data(tenant_chains.tenant.agenda_url)
+    # Obtener fecha actual en formato legible
+    today_str = datetime.now().strftime("%d/%m/%Y")
+    # 3. Obtener instrucción de optimización
+    # Calculamos la regla técnica según lo que el usuario eligió
+    opt_instruction = get_optimization_instruction(platform, media_type)
+
+    # 4. Invocar al Agente con todos los datos necesarios
+    response = tenant_chains.chain.invoke({
+        "platform": platform,
+        "media_type": media_type,
+        "reason": reason,
+        "specific_data": specific_data,
+        "visual_context": visual_context,
+        "user_instructions": user_instructions,
+        "tone_modifier": tone,
+        "agenda_context": agenda_text,
+        "current_date": today_str,
+        "optimization_instruction": opt_instruction
+    })
+
+    # --- LIMPIEZA FINAL ---
+    # Pasamos el texto generado por el filtro para asegurar formato correcto
+    final_clean_text = clean_format_for_platform(response.copy_text, platform)
+    # Validamos las REGLAS DE ORO (autocorrección local + corrección LLM solo si hace falta)
+    final_clean_text, final_hashtags, pending_rules = enforce_brand_rules(
+        final_clean_text, response.hashtags, platform, tenant_chains
+    )
+
+    return {
+        "platform": platform,
+        "copy_text": final_clean_text,
+        "hashtags": final_hashtags,
+        "visual_suggestion": response.visual_suggestion,
+        "pending_rules": [v.message for v in pending_rules]
+    }
+
+def generation_key(*request):
+    """Huella de una petición: dos sesiones con los mismos datos comparten la misma generación."""
+    payload = json.dumps([*request, datetime.now().strftime("%d/%m/%Y")], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+from dotenv import load_dotenv
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from qdrant_client import models
+
+from chain_pool import DEFAULT_TENANT, ChainPool, load_settings
+
+# --- INGESTA DE LA BASE DE CONOCIMIENTO (QDRANT) ---
+# Llena la colección que consulta el retriever a partir de una carpeta de documentos:
+#
+#   conocimiento/
+#   ├── bio/          biografia.md
+#   ├── lyrics/       cancion-1.txt, cancion-2.txt...
+#   ├── discography/  discos.md
+#   └── press/        entrevista-radio-3.md
+#
+# La subcarpeta se guarda como 'category'. Cada fragmento se identifica por el hash de su
+# contenido: si un fragmento no ha cambiado desde la última ingesta no se vuelve a calcular
+# su embedding. Editar una letra cuesta un embedding, no el corpus entero.
+# Cada lote se inserta en cuanto está listo, así que si la ingesta falla a mitad basta con
+# relanzarla: lo ya subido se detecta por hash y se salta (reanudación sin estado extra).
+#
+# Los puntos que ya estuvieran en la colección sin 'content_hash' (cargados por otro proceso)
+# no se pueden comparar por hash: la ingesta se niega a convivir con ellos salvo que se pida
+# --replace-legacy, que los sustituye por los nuevos al terminar.
+#
+# Uso: python ingest.py conocimiento/ [--tenant arrojo] [--batch-size 32] [--concurrency 4]
+#      python ingest_check.py          (comprobación con Qdrant en memoria, sin red)
+
+SOURCE_EXTENSIONS = (".md", ".txt")
+
+# Espacio de nombres fijo para derivar IDs de punto deterministas (uuid5) a partir del hash
+POINT_NAMESPACE = uuid.UUID("6f1c9a52-3d1e-4a8b-9a59-0c7d2b0e4a11")
+
+# Mismas claves de payload que usa QdrantVectorStore de LangChain en el retriever
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Fragmento de un documento listo para indexar."""
+    point_id: str
+    text: str
+    source: str
+    category: str
+    content_hash: str
+
+
+@dataclass
+class IngestReport:
+    """Resumen de una ingesta."""
+    total: int = 0
+    embedded: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self):
+        return self.total / self.seconds if self.seconds else 0.0
+
+
+def iter_documents(root):
+    """Recorre la carpeta de origen y devuelve (ruta_relativa, categoría, texto) en orden estable."""
+    root = Path(root)
+    for path in sorted(root.rglob("*")):
+        if not path.is_file() or path.suffix.lower() not in SOURCE_EXTENSIONS:
+            continue
+        relative = path.relative_to(root)
+        category = relative.parts[0] if len(relative.parts) > 1 else "general"
+        yield relative.as_posix(), category, path.read_text(encoding="utf-8")
+
+
+def iter_chunks(documents, splitter, embedding_model):
+    """
+    Trocea los documentos y calcula el hash de cada fragmento.
+    El hash incluye el modelo de embeddings: cambiar de modelo obliga a recalcularlo todo.
+    """
+    for source, category, text in documents:
+        for piece in splitter.split_text(text):
+            content_hash = hashlib.sha256(f"{embedding_model}\0{piece}".encode("utf-8")).hexdigest()
+            yield Chunk(
+                point_id=str(uuid.uuid5(POINT_NAMESPACE, f"{source}:{content_hash}")),
+                text=piece,
+                source=source,
+                category=category,
+                content_hash=content_hash,
+            )
+
+
+class Ingestor:
+    """
+    Envía fragmentos a Qdrant: embeddings en lotes con concurrencia limitada, upsert en bloque
+    y salto de los fragmentos cuyo hash ya está en la colección.
+    """
+
+    def __init__(self, qdrant_client, embeddings, collection, batch_size=32, concurrency=4, max_retries=3):
+        self.client = qdrant_client
+        self.embeddings = embeddings
+        self.collection = collection
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._collection_ready = False
+        self._collection_lock = threading.Lock()
+
+    def existing_points(self):
+        """
+        Devuelve ({point_id: source} de los puntos creados por esta ingesta (con content_hash),
+        [point_id de los puntos ajenos, sin content_hash]).
+        """
+        if not self.client.collection_exists(self.collection):
+            return {}, []
+        self._collection_ready = True
+
+        existing = {}
+        legacy = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection,
+                limit=1000,
+                offset=offset,
+                with_payload=[METADATA_KEY],
+                with_vectors=False,
+            )
+            for point in points:
+                metadata = (point.payload or {}).get(METADATA_KEY) or {}
+                if "content_hash" in metadata:
+                    existing[str(point.id)] = metadata.get("source")
+                else:
+                    legacy.append(point.id)
+            if offset is None:
+                return existing, legacy
+
+    def _ensure_collection(self, vector_size):
+        # La colección se crea con la dimensión del primer lote de embeddings
+        with self._collection_lock:
+            if self._collection_ready:
+                return
+            if not self.client.collection_exists(self.collection):
+                self.client.create_collection(
+                    collection_name=self.collection,
+                    vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE),
+                )
+            self._collection_ready = True
+
+    def _embed_with_retry(self, texts):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                # Backoff exponencial sencillo ante límites de tasa o cortes de red
+                time.sleep(2 ** attempt)
+
+    def _process_batch(self, batch):
+        vectors = self._embed_with_retry([c.text for c in batch])
+        self._ensure_collection(len(vectors[0]))
+        self.client.upsert(
+            collection_name=self.collection,
+            points=[
+                models.PointStruct(
+                    id=chunk.point_id,
+                    vector=vector,
+                    payload={
+                        CONTENT_KEY: chunk.text,
+                        METADATA_KEY: {
+                            "source": chunk.source,
+                            "category": chunk.category,
+                            "content_hash": chunk.content_hash,
+                        },
+                    },
+                )
+                for chunk, vector in zip(batch, vectors)
+            ],
+            wait=True,
+        )
+        return len(batch)
+
+    def _delete(self, point_ids):
+        if point_ids:
+            self.client.delete(
+                collection_name=self.collection,
+                points_selector=models.PointIdsList(points=point_ids),
+                wait=True,
+            )
+        return len(point_ids)
+
+    def run(self, chunks, prune_missing=False, replace_legacy=False):
+        """
+        Ingesta los fragmentos y elimina los que ya no existen en los documentos procesados.
+        Con prune_missing=True también elimina los de documentos que han desaparecido.
+        Con replace_legacy=True elimina al final los puntos ajenos (sin content_hash); sin él,
+        si la colección los tiene, no se ingesta nada para no duplicar el corpus.
+        """
+        report = IngestReport()
+        start = time.perf_counter()
+        existing, legacy = self.existing_points()
+        if legacy and not replace_legacy:
+            raise RuntimeError(
+                f"La colección '{self.collection}' tiene {len(legacy)} puntos sin content_hash "
+                "(cargados por otro proceso). Ingestar ahora duplicaría el corpus: usa "
+                "--replace-legacy para sustituirlos o una colección nueva."
+            )
+        seen_ids = set()
+        seen_sources = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = set()
+            batch = []
+
+            def submit(batch):
+                # Contrapresión: no más de 2 lotes en cola por worker para no cargar todo en memoria
+                nonlocal in_flight
+                if len(in_flight) >= self.concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        report.embedded += future.result()
+                in_flight.add(executor.submit(self._process_batch, batch))
+
+            for chunk in chunks:
+                report.total += 1
+                seen_sources.add(chunk.source)
+                # Saltamos fragmentos sin cambios y duplicados dentro del mismo documento (estribillos)
+                if chunk.point_id in existing or chunk.point_id in seen_ids:
+                    seen_ids.add(chunk.point_id)
+                    report.skipped += 1
+                    continue
+                seen_ids.add(chunk.point_id)
+                batch.append(chunk)
+                if len(batch) == self.batch_size:
+                    submit(batch)
+                    batch = []
+            if batch:
+                submit(batch)
+
+            for future in in_flight:
+                report.embedded += future.result()
+
+        # Sin ningún documento, "lo que falta" es todo: una carpeta vacía o mal escrita no
+        # puede vaciar la colección
+        if not seen_sources and (prune_missing or legacy):
+            raise RuntimeError("No se ha encontrado ningún documento: no se elimina nada de la colección.")
+
+        # Limpieza: fragmentos antiguos de documentos editados (o borrados, si se pide)
+        stale = [
+            point_id for point_id, source in existing.items()
+            if point_id not in seen_ids and (source in seen_sources or prune_missing)
+        ]
+        report.deleted = self._delete(stale) + self._delete(legacy)
+        report.seconds = time.perf_counter() - start
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta la base de conocimiento del artista en Qdrant.")
+    parser.add_argument("source_dir", help="Carpeta con subcarpetas por categoría (bio, lyrics, discography, press...)")
+    parser.add_argument("--tenant", default=DEFAULT_TENANT, help="Artista cuya colección se actualiza")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=32, help="Fragmentos por llamada de embeddings")
+    parser.add_argument("--concurrency", type=int, default=4, help="Llamadas de embeddings en paralelo")
+    parser.add_argument("--prune-missing", action="store_true", help="Elimina fragmentos de documentos que ya no existen")
+    parser.add_argument("--replace-legacy", action="store_true", help="Sustituye los puntos cargados sin content_hash por otro proceso")
+    args = parser.parse_args()
+
+
+    load_dotenv()
+    settings = load_settings()
+    pool = ChainPool(settings)
+    tenant = pool.tenants[args.tenant]
+    qdrant_client, embeddings = pool.shared_clients()
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    chunks = iter_chunks(iter_documents(args.source_dir), splitter, settings.embedding_model)
+    ingestor = Ingestor(
+        qdrant_client,
+        embeddings,
+        tenant.collection,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+    )
+
+    print(f"Ingestando '{args.source_dir}' en la colección '{tenant.collection}' ({settings.embedding_model})...")
+    try:
+        report = ingestor.run(chunks, prune_missing=args.prune_missing, replace_legacy=args.replace_legacy)
+    except RuntimeError as e:
+        raise SystemExit(f"Error: {e}")
+    print(
+        f"Fragmentos: {report.total} | Nuevos: {report.embedded} | Sin cambios: {report.skipped} | "
+        f"Eliminados: {report.deleted} | {report.seconds:.1f}s ({report.chunks_per_second:.1f} fragmentos/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
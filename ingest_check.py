@@ -0,0 +1,147 @@
+import hashlib
+import sys
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from qdrant_client import QdrantClient, models
+
+from ingest import CONTENT_KEY, METADATA_KEY, Ingestor, iter_chunks, iter_documents
+
+# --- COMPROBACIÓN DE LA INGESTA CON DOBLES LOCALES ---
+# Qdrant en memoria y embeddings falsos (deterministas, sin red) para verificar el
+# rendimiento, la reanudación tras un fallo, el coste de editar un fragmento y las
+# protecciones frente a puntos ajenos y podas sin documentos.
+# Uso: python ingest_check.py   (código de salida 1 si alguna comprobación falla)
+
+COLLECTION = "arrojo_check"
+MODEL = "fake-embeddings"
+
+
+class FakeEmbeddings(Embeddings):
+    """Vectores derivados del hash del texto. Puede fallar en la llamada nº `fail_on_call`."""
+
+    def __init__(self, size=16):
+        self.size = size
+        self.calls = 0
+        self.embedded = 0
+        self.fail_on_call = None
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls += 1
+            if self.calls == self.fail_on_call:
+                raise ConnectionError("corte simulado de la API de embeddings")
+            self.embedded += len(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255 for b in digest[:self.size]]
+
+
+def check(condition, message):
+    """Como assert, pero no desaparece con python -O: sale con código 1."""
+    if not condition:
+        sys.exit(f"FALLO: {message}")
+
+
+def expect_error(error_type, fn, message):
+    try:
+        fn()
+    except error_type:
+        return
+    sys.exit(f"FALLO: {message}")
+
+
+def write_corpus(root):
+    paragraph = "Estrofa {n} de la canción {song}: asfalto, madrugada y guitarras a todo volumen en Madrid."
+    for category, count in (("lyrics", 40), ("bio", 3), ("press", 7)):
+        (root / category).mkdir()
+        for song in range(count):
+            text = "\n\n".join(paragraph.format(n=n, song=f"{category}-{song}") for n in range(6))
+            (root / category / f"doc-{song}.md").write_text(text, encoding="utf-8")
+
+
+def main():
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=0)
+    client = QdrantClient(":memory:")
+    embeddings = FakeEmbeddings()
+
+    def ingestor():
+        return Ingestor(client, embeddings, COLLECTION, batch_size=16, concurrency=4, max_retries=1)
+
+    def count():
+        return client.count(COLLECTION).count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        write_corpus(root)
+
+        def chunks():
+            return iter_chunks(iter_documents(root), splitter, MODEL)
+
+        unique = len({c.point_id for c in chunks()})
+
+        # 1. Fallo a mitad (tercera llamada de embeddings) y reanudación
+        embeddings.fail_on_call = 3
+        expect_error(ConnectionError, lambda: ingestor().run(chunks()), "la ingesta debía fallar en la tercera llamada")
+        uploaded = count()
+        report = ingestor().run(chunks())
+        check(count() == unique, f"tras reanudar hay {count()} puntos, se esperaban {unique}")
+        check(report.skipped == uploaded, f"se saltaron {report.skipped} fragmentos, ya había {uploaded}")
+        check(embeddings.embedded == unique, f"{embeddings.embedded} embeddings para {unique} fragmentos")
+        print(f"Reanudación: {uploaded} fragmentos subidos antes del fallo; "
+              f"{report.embedded} nuevos al relanzar, ninguno recalculado dos veces")
+
+        # 2. Sin cambios: cero embeddings (y medida del rendimiento)
+        embeddings.fail_on_call = None
+        before = embeddings.embedded
+        report = ingestor().run(chunks())
+        check(report.embedded == 0 and embeddings.embedded == before, f"sin cambios se recalcularon: {report}")
+        print(f"Sin cambios: 0 embeddings, {report.chunks_per_second:.0f} fragmentos/s")
+
+        # 3. Editar un fragmento cuesta solo su embedding
+        edited = root / "lyrics" / "doc-7.md"
+        edited.write_text(edited.read_text(encoding="utf-8").replace("Estrofa 2 ", "Estrofa 2 (nueva) "), encoding="utf-8")
+        report = ingestor().run(chunks())
+        check((report.embedded, report.deleted, count()) == (1, 1, unique), f"edición de un fragmento: {report}")
+        print("Edición: 1 embedding y 1 fragmento antiguo eliminado")
+
+        # 4. Rendimiento de una carga completa desde cero
+        client.delete_collection(COLLECTION)
+        report = ingestor().run(chunks())
+        check(count() == unique, f"carga completa con {count()} puntos, se esperaban {unique}")
+        print(f"Carga completa: {report.total} fragmentos en {report.seconds:.2f}s "
+              f"({report.chunks_per_second:.0f} fragmentos/s)")
+
+        # 5. Puntos ajenos (sin content_hash): se rechazan salvo --replace-legacy
+        client.upsert(COLLECTION, points=[models.PointStruct(
+            id=str(uuid.uuid4()),
+            vector=embeddings.embed_query("legacy"),
+            payload={CONTENT_KEY: "Biografía cargada por otro proceso", METADATA_KEY: {"source": "bio.pdf"}},
+        )])
+        expect_error(RuntimeError, lambda: ingestor().run(chunks()),
+                     "la ingesta debía rechazar la colección con puntos ajenos")
+        report = ingestor().run(chunks(), replace_legacy=True)
+        check((report.embedded, report.deleted, count()) == (0, 1, unique), f"sustitución de puntos ajenos: {report}")
+        print("Puntos ajenos: rechazados sin --replace-legacy y sustituidos con él")
+
+        # 6. --prune-missing con una carpeta vacía no borra nada
+        empty = root / "vacia"
+        empty.mkdir()
+        expect_error(RuntimeError,
+                     lambda: ingestor().run(iter_chunks(iter_documents(empty), splitter, MODEL), prune_missing=True),
+                     "la poda con cero documentos debía rechazarse")
+        check(count() == unique, f"la poda rechazada dejó {count()} puntos de {unique}")
+        print("Poda sin documentos: rechazada, colección intacta")
+
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import logging
+import sys
+
+from dotenv import load_dotenv
+from streamlit.web import cli as stcli
+
+import warmup
+
+# --- ARRANQUE DEL CONTENEDOR ---
+# Lanza Streamlit en este mismo proceso después de iniciar el calentamiento, para que la
+# cadena, las conexiones y la agenda que se calientan aquí sean las que usa app.py.
+# Uso: python serve.py [opciones de streamlit run, p. ej. --server.port=8501]
+
+if __name__ == "__main__":
+    load_dotenv()
+    # Los avisos de los hilos en segundo plano (calentamiento, pregeneración) van al log del
+    # contenedor con nivel y hora
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    warmup.start_background_services()
+    sys.argv = ["streamlit", "run", "app.py", *sys.argv[1:]]
+    sys.exit(stcli.main())
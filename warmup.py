@@ -0,0 +1,269 @@
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from agenda import AGENDA_TTL, download_agenda
+from chain_pool import DEFAULT_TENANT, get_pool
+from drafts import start_scheduler
+
+logger = logging.getLogger(__name__)
+
+# --- CALENTAMIENTO Y SONDAS DE DEPENDENCIAS ---
+# Al arrancar el contenedor se construye la cadena, se abren las conexiones (TLS con OpenRouter
+# y Qdrant), se lanza un embedding y una búsqueda reales y se precarga la agenda. Así el primer
+# usuario no paga el arranque en frío. Después, un hilo en segundo plano sondea cada dependencia
+# y guarda su latencia reciente. Qdrant se sondea cada PROBE_INTERVAL; la agenda, al ritmo de
+# su caché (AGENDA_TTL), para no multiplicar las peticiones a Google Sheets; y los embeddings,
+# que son de pago, cada EMBEDDING_PROBE_INTERVAL. Un endpoint HTTP (READINESS_PORT) expone:
+#   GET /ready   -> 200 cuando todo está caliente; vuelve a 503 si una dependencia falla
+#                   PROBE_FAILURE_THRESHOLD sondas seguidas, y a 200 cuando se recupera.
+#                   La agenda no cuenta: sin ella la app funciona ("Error leyendo agenda").
+#   GET /probes  -> estado y latencias (p50/p95) de cada dependencia
+# El endpoint solo escucha en localhost (lo usa el HEALTHCHECK): /probes incluye el texto
+# de los errores, que puede llevar URLs internas de Qdrant u OpenRouter.
+# Toda la configuración sale del mismo .env que usa el pool de cadenas (chain_pool.load_settings).
+
+# Nº de muestras por dependencia para las estadísticas de latencia
+PROBE_WINDOW = 60
+# Segundos entre reintentos mientras las dependencias no están listas
+WARMUP_RETRY_INTERVAL = 10
+READINESS_HOST = "127.0.0.1"
+
+
+class DependencyStats:
+    """Ventana deslizante de latencias y errores de una dependencia."""
+
+    def __init__(self, name, window=PROBE_WINDOW):
+        self.name = name
+        self.latencies = deque(maxlen=window)
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_ok = None
+        self.last_error = None
+        self.last_checked = None
+        self._lock = threading.Lock()
+
+    def record(self, ok, latency_ms, error=None):
+        with self._lock:
+            self.last_ok = ok
+            self.last_checked = time.time()
+            if ok:
+                self.latencies.append(latency_ms)
+                self.consecutive_failures = 0
+                self.last_error = None
+            else:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_error = error
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self.latencies)
+            return {
+                "ok": self.last_ok,
+                "last_ms": round(self.latencies[-1], 1) if self.latencies else None,
+                "p50_ms": round(statistics.median(samples), 1) if samples else None,
+                "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 1) if samples else None,
+                "samples": len(samples),
+                "failures": self.failures,
+                "consecutive_failures": self.consecutive_failures,
+                "error": self.last_error,
+                "last_checked": self.last_checked,
+            }
+
+
+class Warmup:
+    """
+    Calienta las dependencias de un tenant y las sondea periódicamente.
+    Cada comprobación es a la vez paso de calentamiento y sonda de latencia.
+    """
+
+    # La construcción de la cadena solo se hace al calentar; el resto también se sondea
+    WARMUP_ONLY = ("chain",)
+    # Solo informativas: salen en /probes pero no deciden /ready
+    INFORMATIONAL = ("agenda",)
+
+    def __init__(self, pool, tenant_id=DEFAULT_TENANT):
+        self.pool = pool
+        self.tenant = pool.tenants[tenant_id]
+        self.failure_threshold = pool.settings.probe_failure_threshold
+        self.ready = threading.Event()
+        self._vector = None
+        self.checks = OrderedDict([
+            ("chain", self._check_chain),
+            ("qdrant", self._check_qdrant),
+            ("embeddings", self._check_embeddings),
+            ("qdrant_search", self._check_search),
+            ("agenda", self._check_agenda),
+        ])
+        self.stats = {name: DependencyStats(name) for name in self.checks}
+        # Intervalo propio de las sondas caras; el resto usa PROBE_INTERVAL (<= 0 = solo al arrancar)
+        self.probe_intervals = {
+            "embeddings": pool.settings.embedding_probe_interval,
+            "agenda": AGENDA_TTL,
+        }
+
+    # --- Comprobaciones individuales ---
+    def _check_chain(self):
+        self.pool.get(self.tenant.tenant_id)
+        return "cadena construida"
+
+    def _check_qdrant(self):
+        client, _ = self.pool.shared_clients()
+        info = client.get_collection(self.tenant.collection)
+        # Una colección vacía no impide arrancar (quizá falta la ingesta), pero se indica
+        return f"colección '{self.tenant.collection}' con {info.points_count or 0} puntos"
+
+    def _check_embeddings(self):
+        _, embeddings = self.pool.shared_clients()
+        self._vector = embeddings.embed_query("test de diagnóstico")
+        return f"dimensión {len(self._vector)}"
+
+    def _check_search(self):
+        if self._vector is None:
+            raise RuntimeError("No hay vector de prueba (falló el embedding)")
+        client, _ = self.pool.shared_clients()
+        hits = client.query_points(self.tenant.collection, query=self._vector, limit=1).points
+        if not hits:
+            return "sin resultados (¿colección vacía?)"
+        return f"score {hits[0].score:.3f}"
+
+    def _check_agenda(self):
+        if not self.tenant.agenda_url:
+            return "sin URL de agenda configurada"
+        # Descarga real: además de medir, refresca la caché de la agenda que usa la UI.
+        # Por eso se sondea cada AGENDA_TTL: sustituye a la recarga que haría la UI.
+        return f"{len(download_agenda(self.tenant.agenda_url))} caracteres"
+
+    # --- Ejecución ---
+    def check(self, name):
+        """Ejecuta una comprobación y registra su latencia. Devuelve (ok, detalle)."""
+        start = time.perf_counter()
+        try:
+            detail = self.checks[name]()
+        except Exception as e:
+            self.stats[name].record(False, (time.perf_counter() - start) * 1000, str(e))
+            return False, str(e)
+        self.stats[name].record(True, (time.perf_counter() - start) * 1000)
+        return True, detail
+
+    def run_once(self, names=None):
+        """
+        Ejecuta las comprobaciones en orden. Devuelve {nombre: (ok, detalle)}.
+        Sin `names` es el calentamiento completo: marca como listo si todo va bien. Con `names`
+        es una ronda de sondeo: deja de estar listo si alguna dependencia acumula
+        PROBE_FAILURE_THRESHOLD fallos seguidos y vuelve a estarlo cuando se recupera.
+        """
+        results = OrderedDict((name, self.check(name)) for name in (self.checks if names is None else names))
+        if names is None:
+            if all(ok for name, (ok, _) in results.items() if name not in self.INFORMATIONAL):
+                self.ready.set()
+        elif self.failure_threshold > 0:
+            if self.failing():
+                self.ready.clear()
+            else:
+                self.ready.set()
+        return results
+
+    def failing(self):
+        """Dependencias (no informativas) que han fallado PROBE_FAILURE_THRESHOLD sondas seguidas."""
+        return [
+            name for name, stats in self.stats.items()
+            if name not in self.INFORMATIONAL and stats.consecutive_failures >= self.failure_threshold
+        ]
+
+    def run_until_ready(self, retry_interval=WARMUP_RETRY_INTERVAL):
+        # Al arrancar el contenedor puede que Qdrant u OpenRouter aún no respondan
+        while True:
+            self.run_once()
+            if self.ready.is_set():
+                return
+            time.sleep(retry_interval)
+
+    def probe_forever(self, interval):
+        # Cada sonda se lanza cada N rondas de `interval` según su intervalo propio
+        every = {}
+        for name in self.checks:
+            own = self.probe_intervals.get(name, interval)
+            if name not in self.WARMUP_ONLY and own > 0:
+                every[name] = max(1, round(own / interval))
+        rounds = 0
+        while True:
+            time.sleep(interval)
+            rounds += 1
+            self.run_once([name for name, n in every.items() if rounds % n == 0])
+
+    def status(self):
+        return {
+            "ready": self.ready.is_set(),
+            "failing": self.failing() if self.failure_threshold > 0 else [],
+            "tenant": self.tenant.tenant_id,
+            "dependencies": {name: stats.snapshot() for name, stats in self.stats.items()},
+        }
+
+
+class _ReadinessHandler(BaseHTTPRequestHandler):
+    warmup = None
+
+    def do_GET(self):
+        status = self.warmup.status()
+        if self.path == "/ready":
+            code = 200 if status["ready"] else 503
+        elif self.path == "/probes":
+            code = 200
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(status, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # El healthcheck consulta cada pocos segundos: no ensuciamos el log del contenedor
+        pass
+
+
+# --- SERVICIOS EN SEGUNDO PLANO (UNO POR PROCESO) ---
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def start_background_services():
+    """
+    Arranca (una sola vez por proceso) el calentamiento, el sondeo periódico, el endpoint
+    de readiness y la pregeneración de borradores. Devuelve el objeto Warmup compartido.
+    """
+    global _warmup
+    with _warmup_lock:
+        if _warmup is not None:
+            return _warmup
+
+        pool = get_pool()
+        settings = pool.settings
+        _warmup = Warmup(pool)
+
+        def background():
+            _warmup.run_until_ready()
+            # Con todo caliente, arranca la pregeneración de borradores de la agenda
+            start_scheduler()
+            if settings.probe_interval > 0:
+                _warmup.probe_forever(settings.probe_interval)
+
+        threading.Thread(target=background, name="warmup", daemon=True).start()
+
+        handler = type("ReadinessHandler", (_ReadinessHandler,), {"warmup": _warmup})
+        try:
+            server = ThreadingHTTPServer((READINESS_HOST, settings.readiness_port), handler)
+        except OSError as e:
+            logger.warning("No se pudo abrir el endpoint de readiness en el puerto %s: %s", settings.readiness_port, e)
+        else:
+            threading.Thread(target=server.serve_forever, name="readiness", daemon=True).start()
+
+        return _warmup